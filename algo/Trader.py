@@ -5,58 +5,104 @@ from orderbook.Orderbook import Orderbook
 from trading.CrossTrade import CrossTrade
 from wallet.Wallet import Wallet
 
+try:
+    from numba import njit
+except ImportError:
+    # Without Numba, the kernels below just run as plain Python.
+    def njit(*args, **kwargs):
+        return lambda function: function
+
+
+@njit(cache=True, fastmath=True)
+def _crossProfit(askPrice: float, askQuantity: float, bidPrice: float, bidQuantity: float, buyMultiplier: float,
+                 sellMultiplier: float, tradedWithdrawalFee: float, baseWithdrawalFee: float) -> float:
+    """
+    The profit, in the base currency, of buying at the best ask on one exchange and selling at the best bid on the
+    other. The withdrawal fees are those of the exchange we buy at.
+    """
+    quantity = askQuantity if askQuantity < bidQuantity else bidQuantity
+    notionalBought = askPrice * buyMultiplier * quantity + askPrice * tradedWithdrawalFee + baseWithdrawalFee
+    notionalSold = bidPrice * sellMultiplier * quantity
+    return notionalSold - notionalBought
+
 
 class Trader:
+    __slots__ = ("tradedCurrency", "baseCurrency")
+
     def __init__(self, tradedCurrency: str, baseCurrency: str):
         self.tradedCurrency = tradedCurrency
         self.baseCurrency = baseCurrency
 
     def step(self, orderbooks: List[Orderbook], wallets: List[Wallet], logger: Logger) -> List[CrossTrade]:
         trades = []
+        (askPrice0, askQuantity0), (bidPrice0, bidQuantity0) = orderbooks[0].getTopOfBook()
+        (askPrice1, askQuantity1), (bidPrice1, bidQuantity1) = orderbooks[1].getTopOfBook()
 
-        while True:
-            # Keep on checking orderbook 0 to see if there is an opportunity to buy there and sell at exchange 1
-            lowestAsk = orderbooks[0].getLowestAsk()
-            highestBid = orderbooks[1].getHighestBid()
+        # Fees can only make a trade less profitable, so the raw top of book already tells us which direction (if
+        # any) is worth draining: 1 to buy at exchange 0 and sell at exchange 1, -1 for the opposite. If both
+        # directions look profitable, one of the orderbooks is crossed and we don't trust either of them.
+        direction = 0
 
-            if not lowestAsk[0] or not highestBid[0]:
-                break
+        if askPrice0 is not None and bidPrice1 is not None and askPrice0 < bidPrice1:
+            direction += 1
 
-            quantity = min(lowestAsk[1], highestBid[1])
-            notionalTraded0 = lowestAsk[0] * (1.0 + wallets[0].getTradeFee()) * quantity \
-                + lowestAsk[0] * wallets[0].getWithdrawalFee(self.tradedCurrency) \
-                + wallets[0].getWithdrawalFee(self.baseCurrency)
-            notionalTraded1 = highestBid[0] * (1.0 - wallets[1].getTradeFee()) * quantity
-
-            if notionalTraded0 < notionalTraded1:
-                # print("orderbooks[0].getLowestAsk()[0] < orderbooks[1].getHighestBid()[0]:", orderbooks[0].getLowestAsk(), orderbooks[1].getHighestBid())
-                trade = CrossTrade(0, 1, self.tradedCurrency, self.baseCurrency)
-                # Stepping this CrossTrade will take away quantity at the best ask from orderbook 0
-                trade.step(orderbooks, wallets, logger)
-                trades.append(trade)
-            else:
-                break
+        if askPrice1 is not None and bidPrice0 is not None and askPrice1 < bidPrice0:
+            direction -= 1
+
+        if direction == 1:
+            self._drainDirection(0, 1, askPrice0, askQuantity0, bidPrice1, bidQuantity1, orderbooks, wallets, logger,
+                                 trades)
+        elif direction == -1:
+            self._drainDirection(1, 0, askPrice1, askQuantity1, bidPrice0, bidQuantity0, orderbooks, wallets, logger,
+                                 trades)
 
-        while True:
-            # Keep on checking orderbook 1 to see if there is an opportunity to buy there and sell at exchange 0
-            highestBid = orderbooks[0].getHighestBid()
-            lowestAsk = orderbooks[1].getLowestAsk()
+        return trades
+
+    def _drainDirection(self, buyIndex: int, sellIndex: int, askPrice: float, askQuantity: float, bidPrice: float,
+                        bidQuantity: float, orderbooks: List[Orderbook], wallets: List[Wallet], logger: Logger,
+                        trades: List[CrossTrade]):
+        """
+        Keeps on buying at exchange buyIndex and selling at exchange sellIndex while it is profitable.
+        :param askPrice: the lowest ask at exchange buyIndex, as last read
+        :param bidPrice: the highest bid at exchange sellIndex, as last read
+        :param trades: the list to append started trades to
+        """
+        # Fees don't change within a step, so look them up once rather than on every iteration.
+        buyMultiplier = 1.0 + wallets[buyIndex].getTradeFee()
+        sellMultiplier = 1.0 - wallets[sellIndex].getTradeFee()
+        tradedWithdrawalFee = wallets[buyIndex].getWithdrawalFee(self.tradedCurrency)
+        baseWithdrawalFee = wallets[buyIndex].getWithdrawalFee(self.baseCurrency)
+
+        # Bind everything the loop touches to locals so each iteration skips the attribute lookups.
+        crossProfit = _crossProfit
+        tradedCurrency = self.tradedCurrency
+        baseCurrency = self.baseCurrency
+        askOrderbook = orderbooks[buyIndex]
+        bidOrderbook = orderbooks[sellIndex]
+
+        # The Orderbook.version each book's quotes were read at. Only the book we buy from changes when a CrossTrade
+        # is stepped, so the other one doesn't need to be read again.
+        askVersion = askOrderbook.version
+        bidVersion = bidOrderbook.version
 
-            if not highestBid[0] or not lowestAsk[0]:
+        while askPrice is not None and bidPrice is not None:
+            if crossProfit(askPrice, askQuantity, bidPrice, bidQuantity, buyMultiplier, sellMultiplier,
+                           tradedWithdrawalFee, baseWithdrawalFee) <= 0.0:
                 break
 
-            quantity = min(lowestAsk[1], highestBid[1])
-            notionalTraded0 = highestBid[0] * (1.0 - wallets[0].getTradeFee()) * quantity
-            notionalTraded1 = lowestAsk[0] * (1.0 + wallets[1].getTradeFee()) * quantity \
-                + lowestAsk[0] * wallets[1].getWithdrawalFee(self.tradedCurrency) \
-                + wallets[1].getWithdrawalFee(self.baseCurrency)
-            if notionalTraded0 > notionalTraded1:
-                # print("orderbooks[0].getHighestBid()[0] > orderbooks[1].getLowestAsk()[0]:", orderbooks[0].getHighestBid()[0], orderbooks[1].getLowestAsk()[0])
-                trade = CrossTrade(1, 0, self.tradedCurrency, self.baseCurrency)
-                # Stepping this CrossTrade will take away quantity at the best ask from orderbook 1
-                trade.step(orderbooks, wallets, logger)
-                trades.append(trade)
-            else:
+            trade = CrossTrade(buyIndex, sellIndex, tradedCurrency, baseCurrency)
+            # Stepping this CrossTrade will take away quantity at the best ask from the orderbook we buy from
+            trade.step(orderbooks, wallets, logger)
+            trades.append(trade)
+
+            if askOrderbook.version == askVersion and bidOrderbook.version == bidVersion:
+                # The trade couldn't take anything, so the quotes won't change by trying again.
                 break
 
-        return trades
+            if askOrderbook.version != askVersion:
+                askPrice, askQuantity = askOrderbook.getLowestAsk()
+                askVersion = askOrderbook.version
+
+            if bidOrderbook.version != bidVersion:
+                bidPrice, bidQuantity = bidOrderbook.getHighestBid()
+                bidVersion = bidOrderbook.version
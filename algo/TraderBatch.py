@@ -0,0 +1,81 @@
+from typing import List
+
+import numpy as np
+
+from algo.Trader import Trader
+from logger.Logger import Logger
+from orderbook.Orderbook import Orderbook
+from trading.CrossTrade import CrossTrade
+from wallet.Wallet import Wallet
+
+
+class TraderBatch:
+    """
+    Runs several Traders that trade different currency pairs across the same two exchanges. The top of every pair's
+    orderbooks is screened for opportunities with whole-array operations, and only the Traders of pairs that are
+    actually profitable get stepped. Across two exchanges, the only arbitrage cycles a CrossTrade can execute are
+    buying a currency on one exchange and selling it on the other, so checking both directions per pair covers them.
+    """
+    def __init__(self, traders: List[Trader]):
+        self.traders = traders
+
+        # Quotes per pair, kept between steps. Columns: lowest ask 0, its quantity, highest bid 0, its quantity, and
+        # the same for exchange 1.
+        self._quotes = np.full((len(traders), 8), np.nan)
+        # The Orderbook.version each pair's quotes were read at, so that only books that changed get read again.
+        self._orderbookVersions = [[None, None] for _ in traders]
+
+    def step(self, orderbooks: List[List[Orderbook]], wallets: List[Wallet], logger: Logger) -> List[CrossTrade]:
+        """
+        :param orderbooks: for every Trader, the orderbooks of its pair on exchange 0 and exchange 1, which must be
+                           the same objects on every call
+        :param wallets: the wallets of exchange 0 and exchange 1, shared by all pairs
+        :return: the trades started by all Traders
+        """
+        numPairs = len(self.traders)
+        quotes = self._quotes
+        tradedWithdrawalFees = np.empty((numPairs, 2))
+        baseWithdrawalFees = np.empty((numPairs, 2))
+
+        for i in range(numPairs):
+            trader = self.traders[i]
+            versions = self._orderbookVersions[i]
+
+            for exchange in range(2):
+                orderbook = orderbooks[i][exchange]
+
+                if orderbook.version != versions[exchange]:
+                    lowestAsk, highestBid = orderbook.getTopOfBook()
+                    quotes[i, 4 * exchange:4 * exchange + 2] = lowestAsk
+                    quotes[i, 4 * exchange + 2:4 * exchange + 4] = highestBid
+                    versions[exchange] = orderbook.version
+
+            tradedWithdrawalFees[i, 0] = wallets[0].getWithdrawalFee(trader.tradedCurrency)
+            tradedWithdrawalFees[i, 1] = wallets[1].getWithdrawalFee(trader.tradedCurrency)
+            baseWithdrawalFees[i, 0] = wallets[0].getWithdrawalFee(trader.baseCurrency)
+            baseWithdrawalFees[i, 1] = wallets[1].getWithdrawalFee(trader.baseCurrency)
+
+        tradeFee0 = wallets[0].getTradeFee()
+        tradeFee1 = wallets[1].getTradeFee()
+        ask0, askQuantity0, bid0, bidQuantity0, ask1, askQuantity1, bid1, bidQuantity1 = quotes.T
+
+        # Buying at exchange 0 and selling at exchange 1. Missing quotes are NaN, which never compare as profitable.
+        quantity = np.minimum(askQuantity0, bidQuantity1)
+        notionalTraded0 = ask0 * (1.0 + tradeFee0) * quantity + ask0 * tradedWithdrawalFees[:, 0] \
+            + baseWithdrawalFees[:, 0]
+        notionalTraded1 = bid1 * (1.0 - tradeFee1) * quantity
+        profitable = notionalTraded0 < notionalTraded1
+
+        # Buying at exchange 1 and selling at exchange 0.
+        quantity = np.minimum(askQuantity1, bidQuantity0)
+        notionalTraded0 = bid0 * (1.0 - tradeFee0) * quantity
+        notionalTraded1 = ask1 * (1.0 + tradeFee1) * quantity + ask1 * tradedWithdrawalFees[:, 1] \
+            + baseWithdrawalFees[:, 1]
+        profitable |= notionalTraded0 > notionalTraded1
+
+        trades = []
+
+        for i in np.flatnonzero(profitable):
+            trades += self.traders[i].step(orderbooks[i], wallets, logger)
+
+        return trades
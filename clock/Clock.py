@@ -1,44 +1,64 @@
-from abc import ABCMeta
-from abc import abstractmethod
-from datetime import datetime
-
-"""
-A singleton representing a clock.
-"""
-class Clock(metaclass=ABCMeta):
-    _instance = None
-
-    def __init__(self):
-        if not Clock._instance:
-            Clock._instance = self
-        else:
-            print("Only one instance of Clock is allowed!")
-
-        self._listeners = {}
-
-    @staticmethod
-    def getInstance():
-        if not Clock._instance:
-            return Clock()
-        else:
-            return Clock._instance
-
-    @abstractmethod
-    def getTimestamp(self) -> datetime:
-        pass
-
-    def getMinuteTimestamp(self) -> datetime:
-        timestamp = self.getTimestamp()
-        timestamp = timestamp.replace(second=0)
-        timestamp = timestamp.replace(microsecond=0)
-        return timestamp
-
-    def getHourTimestamp(self) -> datetime:
-        timestamp = self.getMinuteTimestamp()
-        timestamp = timestamp.replace(minute=0)
-        return timestamp
-
-    def getDayTimestamp(self) -> datetime:
-        timestamp = self.getHourTimestamp()
-        timestamp = timestamp.replace(hour=0)
-        return timestamp
+from datetime import datetime, timedelta
+
+import clock
+
+# Timestamps are naive UTC datetimes, so we floor them against a naive epoch rather than using datetime.timestamp(),
+# which would treat them as local time.
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+"""
+A clock. The one in use is clock.CLOCK. Subclasses must implement getTimestamp().
+"""
+class Clock:
+    __slots__ = ("_flooredTimestamps",)
+
+    def __init__(self):
+        # Maps seconds per bucket to (epoch second, floored timestamp) of the last call.
+        self._flooredTimestamps = {}
+
+        # The first clock made is the one in use unless startup code assigns clock.CLOCK itself, as getInstance()
+        # callers have always relied on.
+        if clock.CLOCK is None:
+            clock.CLOCK = self
+
+    @staticmethod
+    def getInstance():
+        """
+        Deprecated, read clock.CLOCK instead.
+        """
+        if clock.CLOCK is None:
+            raise RuntimeError("No clock has been made yet, set clock.CLOCK to a RealtimeClock or a SimulatedClock")
+
+        return clock.CLOCK
+
+    def getTimestamp(self) -> datetime:
+        raise NotImplementedError
+
+    def getTimestampNs(self) -> int:
+        """
+        Returns the current time as nanoseconds since the epoch. Prefer this over getTimestamp() when a datetime isn't
+        actually needed, e.g. for ordering or bucketing.
+        """
+        return (self.getTimestamp() - _EPOCH) // _ONE_MICROSECOND * 1000
+
+    def getMinuteTimestamp(self) -> datetime:
+        return self._getFlooredTimestamp(60)
+
+    def getHourTimestamp(self) -> datetime:
+        return self._getFlooredTimestamp(3600)
+
+    def getDayTimestamp(self) -> datetime:
+        return self._getFlooredTimestamp(86400)
+
+    def _getFlooredTimestamp(self, secondsPerBucket: int) -> datetime:
+        epochSeconds = self.getTimestampNs() // 1000000000
+        cached = self._flooredTimestamps.get(secondsPerBucket)
+
+        # These get called many times per second, so only build a new datetime once the second has changed.
+        if cached is not None and cached[0] == epochSeconds:
+            return cached[1]
+
+        timestamp = _EPOCH + timedelta(seconds=epochSeconds - epochSeconds % secondsPerBucket)
+        self._flooredTimestamps[secondsPerBucket] = (epochSeconds, timestamp)
+        return timestamp
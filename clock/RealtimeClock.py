@@ -1,6 +1,13 @@
-from clock.Clock import Clock
-from datetime import datetime
-
-class RealtimeClock(Clock):
-    def getTimestamp(self) -> datetime:
-        return datetime.utcnow()
+import time
+
+from clock.Clock import Clock
+from datetime import datetime
+
+class RealtimeClock(Clock):
+    __slots__ = ()
+
+    # Bound straight to datetime.utcnow, which already returns a naive UTC datetime, to skip a Python-level frame.
+    getTimestamp = staticmethod(datetime.utcnow)
+
+    def getTimestampNs(self) -> int:
+        return time.time_ns()
@@ -1,22 +1,60 @@
-from clock.Clock import Clock
-from datetime import datetime, timedelta
-
-
-class SimulatedClock(Clock):
-    _currentTimestamp: datetime
-
-    def __init__(self, startTimestamp):
-        super().__init__()
-        self._currentTimestamp = startTimestamp
-
-    def getTimestamp(self) -> datetime:
-        return self._currentTimestamp
-
-    def advance(self, timedelta):
-        self._currentTimestamp += timedelta
-
-    def advanceByMinute(self):
-        self._currentTimestamp += timedelta(minutes=1)
-
-    def changeTime(self, timestamp: datetime):
-        self._currentTimestamp = timestamp
+from clock.Clock import Clock
+from datetime import datetime, timedelta
+
+_ONE_MINUTE = timedelta(minutes=1)
+_ONE_HOUR = timedelta(hours=1)
+_ONE_DAY = timedelta(days=1)
+
+
+class SimulatedClock(Clock):
+    __slots__ = ("currentTimestamp", "_minuteTimestamp", "_hourTimestamp", "_dayTimestamp")
+
+    # Public so that code which knows the clock is simulated can read it without a method call.
+    currentTimestamp: datetime
+
+    # The current minute, hour and day, kept up to date as the clock advances since backtests query them constantly.
+    _minuteTimestamp: datetime
+    _hourTimestamp: datetime
+    _dayTimestamp: datetime
+
+    def __init__(self, startTimestamp):
+        super().__init__()
+        self.changeTime(startTimestamp)
+
+    def getTimestamp(self) -> datetime:
+        return self.currentTimestamp
+
+    def getMinuteTimestamp(self) -> datetime:
+        return self._minuteTimestamp
+
+    def getHourTimestamp(self) -> datetime:
+        return self._hourTimestamp
+
+    def getDayTimestamp(self) -> datetime:
+        return self._dayTimestamp
+
+    def advance(self, timedelta):
+        self.currentTimestamp += timedelta
+
+        if not self._minuteTimestamp <= self.currentTimestamp < self._minuteTimestamp + _ONE_MINUTE:
+            self._updateBuckets()
+
+    def advanceByMinute(self):
+        self.currentTimestamp += _ONE_MINUTE
+        self._minuteTimestamp += _ONE_MINUTE
+
+        # Stepping by a minute can only cross into the next hour or day exactly at its first minute.
+        if self._minuteTimestamp - self._hourTimestamp >= _ONE_HOUR:
+            self._hourTimestamp = self._minuteTimestamp
+
+            if self._hourTimestamp - self._dayTimestamp >= _ONE_DAY:
+                self._dayTimestamp = self._hourTimestamp
+
+    def changeTime(self, timestamp: datetime):
+        self.currentTimestamp = timestamp
+        self._updateBuckets()
+
+    def _updateBuckets(self):
+        self._minuteTimestamp = self.currentTimestamp.replace(second=0, microsecond=0)
+        self._hourTimestamp = self._minuteTimestamp.replace(minute=0)
+        self._dayTimestamp = self._hourTimestamp.replace(hour=0)
@@ -0,0 +1,3 @@
+# The clock everything reads the time from. Startup code sets this to a RealtimeClock or a SimulatedClock before
+# anything asks for the time, e.g. clock.CLOCK = SimulatedClock(startTimestamp). Otherwise, it is the first clock made.
+CLOCK = None
@@ -6,26 +6,42 @@
 import csv
 import json
 import math
-from datetime import datetime, timedelta
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
-import re
 import pytz
 import time
 import hmac
 import hashlib
 import requests
+from requests.adapters import HTTPAdapter
 from binance.client import Client
 import threading as th
 
 from connections.PhemexConnection import PhemexConnection
+from data_obtaining.ColumnArrays import ColumnArrays
 from data_obtaining.DataObtainer import DataObtainer
 from logger.Logger import Logger
 from util.Constants import PHEMEX_DATA_FETCH_ATTEMPT_AMOUNT
 from util.Datetime import roundDownToDay, roundDownToHour, roundDownToMinute
 
+try:
+    from orjson import loads as _loadJson
+except ImportError:
+    # orjson only decodes faster, so the standard library does the job without it.
+    _loadJson = json.loads
+
+# Fetching klines is bound by network latency, so requests for different tickers and periods are overlapped.
+_KLINE_FETCH_WORKERS = 16
+_KLINE_FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=_KLINE_FETCH_WORKERS)
+# The most klines Binance sends per request.
+_KLINE_REQUEST_LIMIT = 1000
+# Volumes don't need float64's precision, unlike prices, so they take half the memory.
+_VOLUME_DTYPE = np.float32
+
 
 class BinanceDataObtainer(DataObtainer):
     dateOfStart: datetime
@@ -36,7 +52,14 @@ class BinanceDataObtainer(DataObtainer):
     _1MinDataAsDataFrames: Dict[str, pd.DataFrame]
     _1HourDataAsDataFrames: Dict[str, pd.DataFrame]
     _1DayDataAsDataFrames: Dict[str, pd.DataFrame]
-    _binanceDataLock: th.Lock
+    # Rows added since the DataFrames were last built, so that addRow doesn't copy a whole DataFrame per kline.
+    _1MinPendingRows: Dict[str, List[Dict]]
+    _1HourPendingRows: Dict[str, List[Dict]]
+    _1DayPendingRows: Dict[str, List[Dict]]
+    # Maps (ticker, period) to the ticker's index and columns as arrays.
+    _columnArrays: Dict[Tuple[str, str], ColumnArrays]
+    _binanceDataLock: th.RLock
+    _newData: th.Condition
     _onNewMinute: List
     _onNewHour: List
     _onNewDay: List
@@ -45,13 +68,22 @@ class BinanceDataObtainer(DataObtainer):
         self.filePathPrefix = filePathPrefix
         self.dateOfStart = dateOfStart
         self.binanceClient = Client(api_key="Redacted", api_secret="Redacted")
+        # Keep connections to Binance alive between requests, with enough of them for every kline fetch thread.
+        self.binanceClient.session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=_KLINE_FETCH_WORKERS))
         self.logger = logger
         self.tickers = set()
 
         self._1MinDataAsDataFrames = {}
         self._1HourDataAsDataFrames = {}
         self._1DayDataAsDataFrames = {}
-        self._binanceDataLock = th.Lock()
+        self._1MinPendingRows = {}
+        self._1HourPendingRows = {}
+        self._1DayPendingRows = {}
+        self._columnArrays = {}
+        # Reentrant since pending rows get flushed under the lock by code that may already hold it.
+        self._binanceDataLock = th.RLock()
+        # Notified whenever rows are added, so that the waitFor* methods don't have to poll.
+        self._newData = th.Condition(self._binanceDataLock)
         self._onNewMinute = []
         self._onNewHour = []
         self._onNewDay = []
@@ -61,73 +93,72 @@ class BinanceDataObtainer(DataObtainer):
         thread.start()
 
     def _updateLoop(self):
+        periods = [("1m", roundDownToMinute, timedelta(minutes=1)), ("1h", roundDownToHour, timedelta(hours=1)),
+                   ("1d", roundDownToDay, timedelta(days=1))]
+
         while True:
+            # Binance only has a new kline once a minute, so wait until just after the next one starts.
+            now = datetime.utcnow()
+            nextMinute = roundDownToMinute(now) + timedelta(minutes=1)
+            time.sleep((nextMinute - now).total_seconds() + 0.5)
             currentTime = datetime.utcnow()
 
-            for ticker in self.tickers:
-                with self._binanceDataLock:
-                    if roundDownToMinute(currentTime) >= self._1MinDataAsDataFrames[ticker].index[-1]:
-                        curr = roundDownToMinute(self._1MinDataAsDataFrames[ticker].index[-1])
-                        minutes = self._getKlines(ticker, "1m", curr)
+            fetches = []
 
-                        for row in minutes:
-                            self.addRow(ticker, curr, float(row[1]), float(row[2]), float(row[3]), float(row[4]),
-                                        float(row[5]), period="1m")
-                            curr += timedelta(minutes=1)
+            with self._binanceDataLock:
+                for ticker in self.tickers:
+                    for period, roundDown, step in periods:
+                        last = self._getLastTimestamp(ticker, period)
+
+                        if roundDown(currentTime) >= last:
+                            fetches.append((ticker, period, roundDown(last), step))
 
-                    if roundDownToHour(currentTime) >= self._1HourDataAsDataFrames[ticker].index[-1]:
-                        curr = roundDownToHour(self._1HourDataAsDataFrames[ticker].index[-1])
-                        hours = self._getKlines(ticker, "1h", curr)
+            # Fetch without holding the lock so that readers aren't blocked by the requests.
+            futures = {_KLINE_FETCH_EXECUTOR.submit(self._getKlines, ticker, period, curr): (ticker, period, curr, step)
+                       for ticker, period, curr, step in fetches}
 
-                        for row in hours:
-                            self.addRow(ticker, curr, float(row[1]), float(row[2]), float(row[3]), float(row[4]),
-                                        float(row[5]), period="1h")
-                            curr += timedelta(hours=1)
+            for future in as_completed(futures):
+                ticker, period, curr, step = futures[future]
+                klines = future.result()
 
-                    if roundDownToDay(currentTime) >= self._1DayDataAsDataFrames[ticker].index[-1]:
-                        curr = roundDownToDay(self._1DayDataAsDataFrames[ticker].index[-1])
-                        days = self._getKlines(ticker, "1d", curr)
+                with self._binanceDataLock:
+                    if ticker not in self.tickers:
+                        continue
 
-                        for row in days:
-                            self.addRow(ticker, curr, float(row[1]), float(row[2]), float(row[3]), float(row[4]),
-                                        float(row[5]), period="1d")
-                            curr += timedelta(days=1)
+                    for open, high, low, close, volume in self._parseKlines(klines).tolist():
+                        self.addRow(ticker, curr, open, high, low, close, volume, period=period)
+                        curr += step
 
     def trackTickers(self, tickerPairs: List[str], fileNamePrefix=""):
         """
         :param tickerPairs: e.g. ["BTCUSDT", "ETHUSDT"]
         """
         for t in tickerPairs:
-            self.tickers.add(t)
             self._1MinDataAsDataFrames[t] = pd.DataFrame()
             self._1HourDataAsDataFrames[t] = pd.DataFrame()
             self._1DayDataAsDataFrames[t] = pd.DataFrame()
+            self._1MinPendingRows[t] = []
+            self._1HourPendingRows[t] = []
+            self._1DayPendingRows[t] = []
 
         # This gets historical data for our tickers.
-        for ticker in tickerPairs:
-            with self._binanceDataLock:
-                curr = roundDownToMinute(datetime.utcnow() - timedelta(minutes=1439))
-                minutes = self._getKlines(ticker, "1m", curr)
-
-                for row in minutes:
-                    self.addRow(ticker, curr, float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]), period="1m")
-                    curr += timedelta(minutes=1)
-
-                curr = roundDownToHour(datetime.utcnow() - timedelta(hours=23))
-                hours = self._getKlines(ticker, "1h", curr)
+        now = datetime.utcnow()
+        starts = {"1m": (roundDownToMinute(now - timedelta(minutes=1439)), timedelta(minutes=1)),
+                  "1h": (roundDownToHour(now - timedelta(hours=23)), timedelta(hours=1)),
+                  "1d": (roundDownToDay(now - timedelta(days=1)), timedelta(days=1))}
+        futures = {_KLINE_FETCH_EXECUTOR.submit(self._getKlines, ticker, period, start): (ticker, period)
+                   for ticker in tickerPairs for period, (start, _) in starts.items()}
 
-                for row in hours:
-                    self.addRow(ticker, curr, float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]),
-                                period="1h")
-                    curr += timedelta(hours=1)
+        for future in as_completed(futures):
+            ticker, period = futures[future]
+            start, step = starts[period]
 
-                curr = roundDownToDay(datetime.utcnow() - timedelta(days=1))
-                days = self._getKlines(ticker, "1d", curr)
+            with self._binanceDataLock:
+                self._setHistoricalRows(ticker, future.result(), start, step, period=period)
 
-                for row in days:
-                    self.addRow(ticker, curr, float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]),
-                                period="1d")
-                    curr += timedelta(days=1)
+        # Only let _updateLoop see the tickers once all of their data is there.
+        with self._binanceDataLock:
+            self.tickers.update(tickerPairs)
 
     def stopTrackingTickers(self, tickerPairs: List[str]):
         """
@@ -138,6 +169,13 @@ class BinanceDataObtainer(DataObtainer):
                 self._1MinDataAsDataFrames.pop(ticker)
                 self._1HourDataAsDataFrames.pop(ticker)
                 self._1DayDataAsDataFrames.pop(ticker)
+                self._1MinPendingRows.pop(ticker)
+                self._1HourPendingRows.pop(ticker)
+                self._1DayPendingRows.pop(ticker)
+
+                for period in ["1m", "1h", "1d"]:
+                    self._columnArrays.pop((ticker, period), None)
+
                 self.tickers.remove(ticker)
 
     # This is fast
@@ -150,11 +188,11 @@ class BinanceDataObtainer(DataObtainer):
                 return None
 
             with self._binanceDataLock:
-                df = self._1MinDataAsDataFrames[ticker]
-                return self._filterSingleColumnByTime(df, column, startTime, endTime, 60)
+                self._flushPending(ticker, "1m")
+                return self._filterSingleColumnByTime(ticker, "1m", column, startTime, endTime)
 
-        df = self._1MinDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 60)
+        self._flushPending(ticker, "1m")
+        return self._filterSingleColumnByTime(ticker, "1m", column, startTime, endTime)
 
     # This is fast
     def obtainSingleColumnHourValues(self, ticker: str, column, startTime=None, endTime=None, safeMode=False):
@@ -166,11 +204,11 @@ class BinanceDataObtainer(DataObtainer):
                 return None
 
             with self._binanceDataLock:
-                df = self._1HourDataAsDataFrames[ticker]
-                return self._filterSingleColumnByTime(df, column, startTime, endTime, 3600)
+                self._flushPending(ticker, "1h")
+                return self._filterSingleColumnByTime(ticker, "1h", column, startTime, endTime)
 
-        df = self._1HourDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 3600)
+        self._flushPending(ticker, "1h")
+        return self._filterSingleColumnByTime(ticker, "1h", column, startTime, endTime)
 
     # This is fast
     def obtainSingleColumnDayValues(self, ticker: str, column, startTime=None, endTime=None, safeMode=False):
@@ -182,74 +220,78 @@ class BinanceDataObtainer(DataObtainer):
                 return None
 
             with self._binanceDataLock:
-                df = self._1DayDataAsDataFrames[ticker]
-                return self._filterSingleColumnByTime(df, column, startTime, endTime, 86400)
+                self._flushPending(ticker, "1d")
+                return self._filterSingleColumnByTime(ticker, "1d", column, startTime, endTime)
 
-        df = self._1DayDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 86400)
+        self._flushPending(ticker, "1d")
+        return self._filterSingleColumnByTime(ticker, "1d", column, startTime, endTime)
 
     def addCustomMinuteColumn(self, ticker, columnName, column, updateExisting=True):
-        # with self._binanceDataLock:
-        if updateExisting and columnName in self._1MinDataAsDataFrames[ticker].columns:
-            self._1MinDataAsDataFrames[ticker][columnName].update(column)
-        else:
-            self._1MinDataAsDataFrames[ticker][columnName] = column
+        self._addCustomColumn(ticker, columnName, column, "1m", updateExisting)
 
     def addCustomHourColumn(self, ticker, columnName, column, updateExisting=True):
-        # with self._binanceDataLock:
-        if updateExisting and columnName in self._1HourDataAsDataFrames[ticker].columns:
-            self._1HourDataAsDataFrames[ticker][columnName].update(column)
-        else:
-            self._1HourDataAsDataFrames[ticker][columnName] = column
+        self._addCustomColumn(ticker, columnName, column, "1h", updateExisting)
 
     def addCustomDayColumn(self, ticker, columnName, column, updateExisting=True):
-        # with self._binanceDataLock:
-        if updateExisting and columnName in self._1DayDataAsDataFrames[ticker].columns:
-            self._1DayDataAsDataFrames[ticker][columnName].update(column)
-        else:
-            self._1DayDataAsDataFrames[ticker][columnName] = column
+        self._addCustomColumn(ticker, columnName, column, "1d", updateExisting)
 
     def updateMinuteEntry(self, ticker, columnName, timestamp, value):
-        if columnName not in self._1MinDataAsDataFrames[ticker].columns:
-            self._1MinDataAsDataFrames[ticker][columnName] = 0.0
-
-        self._1MinDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._updateEntry(ticker, columnName, timestamp, value, "1m")
 
     def updateHourEntry(self, ticker, columnName, timestamp, value):
-        if columnName not in self._1HourDataAsDataFrames[ticker].columns:
-            self._1HourDataAsDataFrames[ticker][columnName] = 0.0
-
-        self._1HourDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._updateEntry(ticker, columnName, timestamp, value, "1h")
 
     def updateDayEntry(self, ticker, columnName, timestamp, value):
-        if columnName not in self._1DayDataAsDataFrames[ticker].columns:
-            self._1DayDataAsDataFrames[ticker][columnName] = 0.0
-
-        self._1DayDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._updateEntry(ticker, columnName, timestamp, value, "1d")
 
     def addEmptyMinuteColumn(self, ticker, columnName, fillValue):
-        # with self._binanceDataLock:
-        self._1MinDataAsDataFrames[ticker][columnName] = fillValue
+        self._addEmptyColumn(ticker, columnName, fillValue, "1m")
 
     def addEmptyHourColumn(self, ticker, columnName, fillValue):
-        # with self._binanceDataLock:
-        self._1HourDataAsDataFrames[ticker][columnName] = fillValue
+        self._addEmptyColumn(ticker, columnName, fillValue, "1h")
 
     def addEmptyDayColumn(self, ticker, columnName, fillValue):
-        # with self._binanceDataLock:
-        self._1DayDataAsDataFrames[ticker][columnName] = fillValue
+        self._addEmptyColumn(ticker, columnName, fillValue, "1d")
 
     def removeCustomMinuteColumn(self, ticker, columnName):
-        # with self._binanceDataLock:
-        self._1MinDataAsDataFrames[ticker].drop(columns=[columnName])
+        self._removeCustomColumn(ticker, columnName, "1m")
 
     def removeCustomHourColumn(self, ticker, columnName):
-        # with self._binanceDataLock:
-        self._1HourDataAsDataFrames[ticker].drop(columns=[columnName])
+        self._removeCustomColumn(ticker, columnName, "1h")
 
     def removeCustomDayColumn(self, ticker, columnName):
-        # with self._binanceDataLock:
-        self._1DayDataAsDataFrames[ticker].drop(columns=[columnName])
+        self._removeCustomColumn(ticker, columnName, "1d")
+
+    def _addCustomColumn(self, ticker, columnName, column, period, updateExisting):
+        df = self._getDataFrameToChange(ticker, period)
+
+        if updateExisting and columnName in df.columns:
+            self._updateColumn(df, columnName, column)
+        else:
+            df[columnName] = column
+
+    def _updateEntry(self, ticker, columnName, timestamp, value, period):
+        df = self._getDataFrameToChange(ticker, period)
+
+        if columnName not in df.columns:
+            df[columnName] = 0.0
+
+        df.at[timestamp, columnName] = value
+
+    def _addEmptyColumn(self, ticker, columnName, fillValue, period):
+        self._getDataFrameToChange(ticker, period)[columnName] = fillValue
+
+    def _removeCustomColumn(self, ticker, columnName, period):
+        del self._getDataFrameToChange(ticker, period)[columnName]
+
+    def _getDataFrameToChange(self, ticker, period) -> pd.DataFrame:
+        """
+        Returns a ticker's DataFrame with its pending rows flushed into it, for changing in place.
+        """
+        self._flushPending(ticker, period)
+        self._columnArrays.pop((ticker, period), None)
+        dataFrames, _, _ = self._getPeriodData(period)
+        return dataFrames[ticker]
 
     def runOnNewMinute(self, func):
         self._onNewMinute.append(func)
@@ -263,139 +305,194 @@ class BinanceDataObtainer(DataObtainer):
     def addRow(self, tickerPair, timestamp, open, high, low, close, volume, period="1m"):
         open, high, low, close, volume = self._fixNan(open, high, low, close, volume)
 
-        average = (high + low + close) / 3
-        data = [[timestamp, open, high, low, close, volume, average]]
+        row = {"Timestamp": timestamp, "Open": open, "High": high, "Low": low, "Close": close, "Volume": volume}
+        dataFrames, pendingRows, callbacks = self._getPeriodData(period)
+        df = dataFrames[tickerPair]
+        pending = pendingRows[tickerPair]
 
-        data = pd.DataFrame(data, index=[0], columns=["Timestamp", "Open", "High", "Low", "Close", "Volume", "Average"])
-        data = data.set_index("Timestamp")
+        if len(pending) > 0 and pending[-1]["Timestamp"] == timestamp:
+            pending[-1] = row
+        elif timestamp in df.index:
+            # Overwrite the row in place rather than building a DataFrame just to update the DataFrame with.
+            for column in ["Open", "High", "Low", "Close", "Volume"]:
+                df.at[timestamp, column] = row[column]
 
-        if period == "1m":
-            if timestamp in self._1MinDataAsDataFrames[tickerPair].index:
-                self._1MinDataAsDataFrames[tickerPair].update(data)
-            else:
-                columns = ["Open", "High", "Low", "Close", "Volume"]
-
-                if len(self._1MinDataAsDataFrames[tickerPair]) > 0:
-                    line = str(self._1MinDataAsDataFrames[tickerPair].iloc[-1][columns].values) \
-                        .replace("\n", " ").replace("[", "").replace("]", "")
-                    line = re.sub(" +", " ", line)
-                    line = str(self._1MinDataAsDataFrames[tickerPair].index[-1]).replace(":", "/")\
-                           .replace("-", "/") + "," + line.replace(" ", ",")
-                    self.logger.writeSecondary("binance_price_data_1m", line)
-                else:
-                    # We are here when we are getting historical data at the beginning of the bot runtime.
-                    for timestamp, row in data.iterrows():
-                        line = str(row[columns].values).replace("\n", " ").replace("[", "")\
-                            .replace("]", "")
-                        line = re.sub(" +", " ", line)
-                        line = str(timestamp).replace(":", "/").replace("-", "/") \
-                               + "," + line.replace(" ", ",")
-                        self.logger.writeSecondary("binance_price_data_1m", line)
-
-                self._1MinDataAsDataFrames[tickerPair] = pd.concat([self._1MinDataAsDataFrames[tickerPair], data], sort=True)
-
-            for func in self._onNewMinute:
-                func(timestamp)
-        elif period == "1h":
-            if timestamp in self._1HourDataAsDataFrames[tickerPair].index:
-                self._1HourDataAsDataFrames[tickerPair].update(data)
-            else:
-                columns = ["Open", "High", "Low", "Close", "Volume"]
-
-                if len(self._1HourDataAsDataFrames[tickerPair]) > 0:
-                    line = str(self._1HourDataAsDataFrames[tickerPair].iloc[-1][columns].values) \
-                        .replace("\n", " ").replace("[", "").replace("]", "")
-                    line = re.sub(" +", " ", line)
-                    line = str(self._1HourDataAsDataFrames[tickerPair].index[-1]).replace(":", "/") \
-                               .replace("-", "/") + "," + line.replace(" ", ",")
-                    self.logger.writeSecondary("binance_price_data_1h", line)
-                else:
-                    # We are here when we are getting historical data at the beginning of the bot runtime.
-                    for timestamp, row in data.iterrows():
-                        line = str(row[columns].values).replace("\n", " ").replace("[", "") \
-                            .replace("]", "")
-                        line = re.sub(" +", " ", line)
-                        line = str(timestamp).replace(":", "/").replace("-", "/") \
-                               + "," + line.replace(" ", ",")
-                        self.logger.writeSecondary("binance_price_data_1h", line)
-
-                self._1HourDataAsDataFrames[tickerPair] = pd.concat([self._1HourDataAsDataFrames[tickerPair], data], sort=True)
-
-            for func in self._onNewHour:
-                func(timestamp)
+            df.at[timestamp, "Average"] = (high + low + close) / 3
+            self._columnArrays.pop((tickerPair, period), None)
         else:
-            # 1 day
-            if timestamp in self._1DayDataAsDataFrames[tickerPair].index:
-                self._1DayDataAsDataFrames[tickerPair].update(data)
+            columns = ["Open", "High", "Low", "Close", "Volume"]
+
+            if len(pending) > 0:
+                last = pending[-1]
+                self._logRow(period, last["Timestamp"], [last[column] for column in columns])
+            elif len(df) > 0:
+                self._logRow(period, df.index[-1], [df[column].iat[-1] for column in columns])
             else:
-                columns = ["Open", "High", "Low", "Close", "Volume"]
-
-                if len(self._1DayDataAsDataFrames[tickerPair]) > 0:
-                    line = str(self._1DayDataAsDataFrames[tickerPair].iloc[-1][columns].values) \
-                        .replace("\n", " ").replace("[", "").replace("]", "")
-                    line = re.sub(" +", " ", line)
-                    line = str(self._1DayDataAsDataFrames[tickerPair].index[-1]).replace(":", "/") \
-                               .replace("-", "/") + "," + line.replace(" ", ",")
-                    self.logger.writeSecondary("binance_price_data_1d", line)
-                else:
-                    # We are here when we are getting historical data at the beginning of the bot runtime.
-                    for timestamp, row in data.iterrows():
-                        line = str(row[columns].values).replace("\n", " ").replace("[", "") \
-                            .replace("]", "")
-                        line = re.sub(" +", " ", line)
-                        line = str(timestamp).replace(":", "/").replace("-", "/") \
-                               + "," + line.replace(" ", ",")
-                        self.logger.writeSecondary("binance_price_data_1d", line)
-
-                self._1DayDataAsDataFrames[tickerPair] = pd.concat([self._1DayDataAsDataFrames[tickerPair], data], sort=True)
-
-            for func in self._onNewDay:
+                # We are here when we are getting historical data at the beginning of the bot runtime.
+                self._logRow(period, timestamp, [row[column] for column in columns])
+
+            pending.append(row)
+
+        with self._newData:
+            self._newData.notify_all()
+
+        for func in callbacks:
+            func(timestamp)
+
+    def _setHistoricalRows(self, tickerPair, klines, start, step: timedelta, period="1m"):
+        """
+        Replaces a ticker's rows with klines from Binance, building the DataFrame in one go rather than through addRow.
+        :param start: the timestamp of the first kline
+        :param step: the time between klines
+        """
+        dataFrames, pendingRows, callbacks = self._getPeriodData(period)
+        columns = ["Open", "High", "Low", "Close", "Volume"]
+        values = self._parseKlines(klines)
+        self._fixNans(values)
+
+        index = pd.date_range(start=start, periods=len(values), freq=step, name="Timestamp")
+
+        df = pd.DataFrame(values, index=index, columns=columns)
+        df["Volume"] = df["Volume"].astype(_VOLUME_DTYPE)
+        df["Average"] = (df["High"] + df["Low"] + df["Close"]) / 3
+        # Keep the column order that addRow's concat(sort=True) gives.
+        dataFrames[tickerPair] = df.sort_index(axis=1)
+        pendingRows[tickerPair] = []
+
+        # Like addRow, leave the last row unlogged until the next one arrives, since it may still be updated. The
+        # rows are logged as one message so that the logger writes them all at once.
+        lines = [self._formatRow(timestamp, row) for timestamp, row in zip(index[:-1], values[:-1].tolist())]
+
+        if len(lines) > 0:
+            self.logger.writeSecondary("binance_price_data_" + period, "\n".join(lines))
+
+        with self._newData:
+            self._newData.notify_all()
+
+        for timestamp in index:
+            for func in callbacks:
                 func(timestamp)
 
-    def _addAverage(self, ticker, period):
+    def _parseKlines(self, klines) -> np.ndarray:
+        """
+        :return: the open, high, low, close and volume of each kline as a row of an array
+        """
+        # Columns 1 to 5 of a Binance kline are its open, high, low, close and volume, as strings. NumPy converts them
+        # all in one go.
+        return np.array([row[1:6] for row in klines], dtype=np.float64).reshape(-1, 5)
+
+    def _logRow(self, period, timestamp, values):
+        self.logger.writeSecondary("binance_price_data_" + period, self._formatRow(timestamp, values))
+
+    def _formatRow(self, timestamp, values):
+        return timestamp.strftime("%Y/%m/%d %H/%M/%S") + "," + ",".join([str(value) for value in values])
+
+    def _getPeriodData(self, period):
+        """
+        :return: the DataFrames, pending rows and new row callbacks of a period
+        """
         if period == "1m":
-            df = self._1MinDataAsDataFrames[ticker]
+            return self._1MinDataAsDataFrames, self._1MinPendingRows, self._onNewMinute
         elif period == "1h":
-            df = self._1HourDataAsDataFrames[ticker]
+            return self._1HourDataAsDataFrames, self._1HourPendingRows, self._onNewHour
         else:
-            df = self._1DayDataAsDataFrames[ticker]
+            return self._1DayDataAsDataFrames, self._1DayPendingRows, self._onNewDay
 
-        df["Average"] = (df["High"] + df["Low"] + df["Close"]) / 3
+    def _flushPending(self, ticker, period):
+        """
+        Adds the rows that addRow buffered to the ticker's DataFrame, all in one concat.
+        """
+        dataFrames, pendingRows, _ = self._getPeriodData(period)
 
-    def _filterByTime(self, df: pd.DataFrame, startTime, endTime, secondsBetweenEntries: int, column=None):
-        if startTime is None:
-            start = 0
-        else:
-            start = max(0, int((startTime - df.index[0]).total_seconds() // secondsBetweenEntries))
+        with self._binanceDataLock:
+            pending = pendingRows[ticker]
 
-        if endTime is None:
-            end = len(df)
-        else:
-            end = max(0, int((endTime - df.index[0]).total_seconds() // secondsBetweenEntries)) + 1
+            if len(pending) == 0:
+                return
+
+            old = dataFrames[ticker]
+            dataFrames[ticker] = pd.concat([old, self._rowsToDataFrame(pending)], sort=True, copy=False)
+            pendingRows[ticker] = []
+            cached = self._columnArrays.get((ticker, period))
+
+            if cached is not None and cached.df is old:
+                cached.append(dataFrames[ticker])
+
+    def _rowsToDataFrame(self, rows):
+        """
+        Builds a DataFrame out of rows from addRow, working out their averages all at once.
+        """
+        df = pd.DataFrame(rows).set_index("Timestamp")
+        df["Volume"] = df["Volume"].astype(_VOLUME_DTYPE)
+        df["Average"] = (df["High"].to_numpy() + df["Low"].to_numpy() + df["Close"].to_numpy()) / 3
+        return df
+
+    def _getLastTimestamp(self, ticker, period):
+        dataFrames, pendingRows, _ = self._getPeriodData(period)
+        pending = pendingRows[ticker]
+
+        if len(pending) > 0:
+            return pending[-1]["Timestamp"]
+
+        return dataFrames[ticker].index[-1]
+
+    def _filterByTime(self, df: pd.DataFrame, startTime, endTime, column=None):
+        start, end = self._findBounds(df.index, startTime, endTime)
 
         if column is not None:
             return df[column].iloc[start:end]
 
         return df.iloc[start:end]
 
-    def _filterSingleColumnByTime(self, df: pd.DataFrame, column: str, startTime, endTime, secondsBetweenEntries: int):
-        if startTime is None:
-            start = 0
-        else:
-            start = max(0, int((startTime - df.index[0]).total_seconds() // secondsBetweenEntries))
+    def _filterSingleColumnByTime(self, ticker: str, period: str, column: str, startTime, endTime):
+        index, values = self._getColumnArray(ticker, period, column)
+        start, end = self._findBounds(index, startTime, endTime)
+        x = values[start:end]
+        # This is a view of the cached column, so don't let callers change it underneath us.
+        x.flags.writeable = False
+        return x
 
-        if endTime is None:
-            end = len(df)
-        else:
-            end = max(0, int((endTime - df.index[0]).total_seconds() // secondsBetweenEntries)) + 1
+    def _getColumnArray(self, ticker: str, period: str, column: str):
+        """
+        Returns the index of a ticker's DataFrame and one of its columns as arrays. These are cached since reading a
+        column through the DataFrame builds a Series every time, and _flushPending appends new rows to them. Anything
+        else that changes a DataFrame in place must pop its entry from _columnArrays, while replaced DataFrames are
+        noticed here.
+        """
+        dataFrames, _, _ = self._getPeriodData(period)
+        df = dataFrames[ticker]
+        cached = self._columnArrays.get((ticker, period))
 
-        x = df[column].values[start:end]
+        if cached is None or cached.df is not df:
+            cached = ColumnArrays(df)
+            self._columnArrays[(ticker, period)] = cached
 
-        if len(x) == 0:
-            print("UH OH", start, end, startTime, endTime, df.index[0])
-            print(df.tail)
+        return cached.index[:cached.length], cached.getColumn(column)
 
-        return x
+    def _requestKlines(self, symbol, klineSize, startTime: int, endTime: int):
+        delay = 1.0
+
+        # We loop infinitely (rather than trying 5 times and giving up) because
+        # this function gets called by code that cannot progress until we get
+        # our data.
+        while True:
+            try:
+                response = self.binanceClient.session.get(self.binanceClient.API_URL + "/v3/klines",
+                                                          params={"symbol": symbol, "interval": klineSize,
+                                                                  "startTime": startTime, "endTime": endTime,
+                                                                  "limit": _KLINE_REQUEST_LIMIT},
+                                                          timeout=10)
+
+                if response.status_code == 418 or response.status_code == 429:
+                    # We are being rate limited, and Binance tells us how long to back off for.
+                    time.sleep(float(response.headers.get("Retry-After", delay)))
+                    continue
+
+                response.raise_for_status()
+                return _loadJson(response.content)
+            except (requests.exceptions.RequestException, ValueError):
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
 
     def _getHistoricalKlines(self, symbol, klineSize, startTime, endTime):
         klines = self.binanceClient.get_historical_klines(symbol, klineSize, startTime.strftime("%d %b %Y %H:%M:%S"),
@@ -413,35 +510,31 @@ class BinanceDataObtainer(DataObtainer):
 
         for i in range(5):
             try:
-                trades = self.binanceClient.get_aggregate_trades(symbol=tickerPair, startTime=now - 4000,
-                                                                 endTime=now,
-                                                                 limit=20)
+                # Request the trades ourselves rather than through get_aggregate_trades so that the response can be
+                # decoded straight from its bytes.
+                response = self.binanceClient.session.get(self.binanceClient.API_URL + "/v3/aggTrades",
+                                                          params={"symbol": tickerPair, "startTime": now - 4000,
+                                                                  "endTime": now, "limit": 20},
+                                                          timeout=10)
+                response.raise_for_status()
+                trades = _loadJson(response.content)
                 success = True
                 break
-            except requests.exceptions.ReadTimeout:
+            except (requests.exceptions.RequestException, ValueError):
                 print("Connection error...")
                 time.sleep(2.0)
 
         if not success or len(trades) == 0:
             print("Failed to get current Binance price!")
+            self._flushPending(tickerPair, "1m")
             return self._1MinDataAsDataFrames[tickerPair].iloc[-1]["Close"], self._1MinDataAsDataFrames[tickerPair].iloc[-1]["High"],\
                    self._1MinDataAsDataFrames[tickerPair].iloc[-1]["Low"]
 
-        price = 0.0
-        low = float(trades[0]['p'])
-        high = float(trades[0]['p'])
-        # volume = 0.0
-
-        for trade in trades:
-            p = float(trade['p'])
-            # q = float(trade['q'])
-            price += p
-            high = max(high, p)
-            low = min(low, p)
-            # volume += q
-
-        price /= len(trades)
-        # volume /= len(trades)
+        # NumPy parses all of the price strings in one go.
+        prices = np.array([trade['p'] for trade in trades], dtype=np.str_).astype(np.float64)
+        price = prices.mean()
+        high = prices.max()
+        low = prices.min()
 
         self.logger.writeSecondary("data_stream",
                                    "PhemexConnection getOldMinuteKlineAtTimestamp: got kline at"
@@ -455,10 +548,14 @@ class BinanceDataObtainer(DataObtainer):
                 or not self._obtainedDayHistoricalPhemexKlines:
             return False
 
+        now = datetime.utcnow()
+        minute = roundDownToMinute(now)
+        hour = roundDownToHour(now)
+        day = roundDownToDay(now)
+
         for ticker in self._1MinDataAsDataFrames.keys():
-            if self.getLastMinute(ticker) != datetime.utcnow().replace(second=0, microsecond=0)\
-                and self.getLastHour(ticker) != datetime.utcnow().replace(minute=0, second=0, microsecond=0)\
-                and self.getLastDay(ticker) != datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0):
+            if self.getLastMinute(ticker) != minute and self.getLastHour(ticker) != hour\
+                    and self.getLastDay(ticker) != day:
                 return False
 
         return True
@@ -538,15 +635,15 @@ class BinanceDataObtainer(DataObtainer):
 
     def getLastMinute(self, ticker):
         with self._binanceDataLock:
-            return self._1MinDataAsDataFrames[ticker].index[-1]
+            return self._getLastTimestamp(ticker, "1m")
 
     def getLastHour(self, ticker):
         with self._binanceDataLock:
-            return self._1HourDataAsDataFrames[ticker].index[-1]
+            return self._getLastTimestamp(ticker, "1h")
 
     def getLastDay(self, ticker):
         with self._binanceDataLock:
-            return self._1DayDataAsDataFrames[ticker].index[-1]
+            return self._getLastTimestamp(ticker, "1d")
 
     def obtainMinuteValues(self, ticker: str, startTime=None, endTime=None, column=None, safeMode=False):
         if safeMode:
@@ -557,11 +654,13 @@ class BinanceDataObtainer(DataObtainer):
                 return None
 
             with self._binanceDataLock:
+                self._flushPending(ticker, "1m")
                 df = self._1MinDataAsDataFrames[ticker]
-                return self._filterByTime(df, startTime, endTime, 60, column=column)
+                return self._filterByTime(df, startTime, endTime, column=column)
 
+        self._flushPending(ticker, "1m")
         df = self._1MinDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 60, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     def obtainHourValues(self, ticker: str, startTime=None, endTime=None, column=None, safeMode=False):
         if safeMode:
@@ -572,11 +671,13 @@ class BinanceDataObtainer(DataObtainer):
                 return None
 
             with self._binanceDataLock:
+                self._flushPending(ticker, "1h")
                 df = self._1HourDataAsDataFrames[ticker]
-                return self._filterByTime(df, startTime, endTime, 3600, column=column)
+                return self._filterByTime(df, startTime, endTime, column=column)
 
+        self._flushPending(ticker, "1h")
         df = self._1HourDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 3600, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     def obtainDayValues(self, ticker: str, startTime=None, endTime=None, column=None, safeMode=False):
         if safeMode:
@@ -587,11 +688,13 @@ class BinanceDataObtainer(DataObtainer):
                 return None
 
             with self._binanceDataLock:
+                self._flushPending(ticker, "1d")
                 df = self._1DayDataAsDataFrames[ticker]
-                return self._filterByTime(df, startTime, endTime, 86400, column=column)
+                return self._filterByTime(df, startTime, endTime, column=column)
 
+        self._flushPending(ticker, "1d")
         df = self._1DayDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 86400, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     def waitForMinute(self, ticker, dt, allowAnyWaitTime=False):
         if dt is None:
@@ -606,16 +709,8 @@ class BinanceDataObtainer(DataObtainer):
                 return False
             else:
                 # Wait until we have updated our data to accommodate the start time.
-                # print("removeme: waiting min")
-                while True:
-                    last = self.getLastMinute(ticker)
-
-                    if dt <= last:
-                        # print("exited cuz", last, dt)
-                        # print(self._1MinDataAsDataFrames[ticker].iloc[len(self._1MinDataAsDataFrames[ticker]) - 3:len(self._1MinDataAsDataFrames[ticker])])
-                        return True
-
-                    time.sleep(1.0)
+                with self._newData:
+                    self._newData.wait_for(lambda: dt <= self._getLastTimestamp(ticker, "1m"))
 
         return True
 
@@ -632,13 +727,8 @@ class BinanceDataObtainer(DataObtainer):
                 return False
             else:
                 # Wait until we have updated our data to accommodate the start time.
-                while True:
-                    last = self.getLastHour(ticker)
-
-                    if dt <= last:
-                        return True
-
-                    time.sleep(1.0)
+                with self._newData:
+                    self._newData.wait_for(lambda: dt <= self._getLastTimestamp(ticker, "1h"))
 
         return True
 
@@ -655,17 +745,16 @@ class BinanceDataObtainer(DataObtainer):
                 return False
             else:
                 # Wait until we have updated our data to accommodate the start time.
-                while True:
-                    last = self.getLastDay(ticker)
-
-                    if dt <= last:
-                        return True
-
-                    time.sleep(1.0)
+                with self._newData:
+                    self._newData.wait_for(lambda: dt <= self._getLastTimestamp(ticker, "1d"))
 
         return True
 
     def _fixNan(self, open, high, low, close, volume):
+        # A NaN anywhere makes the sum NaN, so rows without any only cost one check.
+        if not math.isnan(open + high + low + close + volume):
+            return open, high, low, close, volume
+
         if math.isnan(volume):
             print("PhemexDataObtainer _fixNan: received a NaN volume.")
             volume = 0
@@ -702,18 +791,22 @@ class BinanceDataObtainer(DataObtainer):
 
     def _getKlines(self, symbol, kline_size, oldest, fileNamePrefix=""):
         newest = datetime.utcnow()
-
-        # We loop infinitely (rather than trying 5 times and giving up) because
-        # this function gets called by code that cannot progress until we get
-        # our data.
-        while True:
-            try:
-                klines = self.binanceClient.get_historical_klines(symbol, kline_size,
-                    oldest.strftime("%d %b %Y %H:%M:%S"), newest.strftime("%d %b %Y %H:%M:%S"))
+        # Binance wants milliseconds since the epoch, and our datetimes are naive UTC.
+        startTime = int(oldest.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        endTime = int(newest.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        klines = []
+
+        # Request the klines ourselves rather than through get_historical_klines, which makes more requests than it
+        # needs to. Each request gets up to _KLINE_REQUEST_LIMIT klines starting at startTime.
+        while startTime <= endTime:
+            batch = self._requestKlines(symbol, kline_size, startTime, endTime)
+            klines += batch
+
+            if len(batch) < _KLINE_REQUEST_LIMIT:
                 break
-            except:
-                # print("_getKlines() connection error.")
-                time.sleep(2.0)
+
+            # Column 6 of a kline is its close time.
+            startTime = batch[-1][6] + 1
 
         return klines
         # data = pd.DataFrame(klines, columns=['Timestamp', 'Open', 'High', 'Low',
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+# Column arrays start with room for a day of minutes plus some, and double whenever they fill up.
+_CAPACITY = 2048
+
+
+class ColumnArrays:
+    """
+    A ticker's index and columns as arrays with spare room at the end, so that rows flushed into its DataFrame can be
+    appended to them instead of every array being taken out of the DataFrame again.
+    """
+    __slots__ = ("df", "length", "index", "columns")
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.length = len(df)
+        capacity = _CAPACITY
+
+        while capacity < self.length:
+            capacity *= 2
+
+        # Timestamps are kept in nanoseconds whatever unit the DataFrame uses, so that searching them with a
+        # nanosecond key never has to convert the whole array.
+        self.index = np.empty(capacity, dtype="datetime64[ns]")
+        self.index[:self.length] = df.index.values
+        self.columns = {}
+
+    def getColumn(self, column: str) -> np.ndarray:
+        if column not in self.columns:
+            values = self.df[column].to_numpy()
+            array = np.empty(len(self.index), dtype=values.dtype)
+            array[:self.length] = values
+            self.columns[column] = array
+
+        return self.columns[column][:self.length]
+
+    def append(self, df: pd.DataFrame):
+        """
+        Catches up with df, which must be self.df with rows added to the end.
+        """
+        length = len(df)
+        capacity = len(self.index)
+
+        if length > capacity:
+            while capacity < length:
+                capacity *= 2
+
+            self.index = self._grow(self.index, capacity)
+
+            for column in self.columns:
+                self.columns[column] = self._grow(self.columns[column], capacity)
+
+        self.index[self.length:length] = df.index.values[self.length:]
+
+        for column in list(self.columns):
+            values = df[column].to_numpy()
+
+            if values.dtype != self.columns[column].dtype:
+                # The new rows changed the column's type, so take it out of the DataFrame again when it is next read.
+                del self.columns[column]
+            else:
+                self.columns[column][self.length:length] = values[self.length:]
+
+        self.df = df
+        self.length = length
+
+    def _grow(self, array: np.ndarray, capacity: int) -> np.ndarray:
+        grown = np.empty(capacity, dtype=array.dtype)
+        grown[:self.length] = array[:self.length]
+        return grown
@@ -4,13 +4,27 @@
 # Description: Keeps track of stock prices to the minute, simulated or real
 #              clock. This is an abstract class.
 
-from datetime import datetime
-from typing import Dict, List
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import numpy as np
 import pandas as pd
+import re
 
 from abc import ABCMeta
 from abc import abstractmethod
 
+# The layouts that historical CSV timestamps come in. A file in one of them is parsed in one go rather than by
+# splitting each timestamp into its fields, which is many times slower.
+_TIMESTAMP_FORMATS = ["%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d %H/%M/%S", "%d-%m-%Y %H:%M:%S",
+                      "%d-%m-%Y %H:%M"]
+# Splits CSV timestamps into their fields.
+_TIMESTAMP_SEPARATORS = re.compile(r'[-/:\s]\s*')
+# The columns of the saved price CSVs that are used, and their types.
+_CSV_TYPES = {"timestamp": str, "open": np.float64, "high": np.float64, "low": np.float64, "close": np.float64,
+              "trades": np.float64}
+# The columns of the DataFrames that are read from the CSVs, and the CSV columns they come from.
+_CSV_COLUMNS = {"Open": "open", "High": "high", "Low": "low", "Close": "close", "Volume": "trades"}
+
 class DataObtainer(metaclass=ABCMeta):
     """
     Lets the obtainer know that the following stocks
@@ -150,3 +164,148 @@ class DataObtainer(metaclass=ABCMeta):
     @abstractmethod
     def getIntraMinuteKline(self, tickerPair):
         pass
+
+    """
+    Fixes NaNs in rows of open, high, low, close and volume, in place and for all
+    rows at once. Like _fixNan in the live obtainers, a missing volume becomes 0, a
+    missing open or close becomes the first price the row has, a missing high or low
+    the highest or lowest of them, and a row without any prices gets 0 for all of them.
+    """
+    def _fixNans(self, values: np.ndarray):
+        open, high, low, close, volume = values[:, 0], values[:, 1], values[:, 2], values[:, 3], values[:, 4]
+        missing = np.isnan(values)
+        numRows = np.count_nonzero(missing.any(axis=1))
+
+        if numRows == 0:
+            return
+
+        print("DataObtainer _fixNans: fixing " + str(numRows) + " rows with NaNs.")
+        first = np.where(missing[:, 0], np.where(missing[:, 1], np.where(missing[:, 2], close, low), high), open)
+        first = np.nan_to_num(first, nan=0.0)
+        # fmax and fmin skip NaNs.
+        highest = np.nan_to_num(np.fmax.reduce(values[:, :4], axis=1), nan=0.0)
+        lowest = np.nan_to_num(np.fmin.reduce(values[:, :4], axis=1), nan=0.0)
+        values[:, 0] = np.where(missing[:, 0], first, open)
+        values[:, 1] = np.where(missing[:, 1], highest, high)
+        values[:, 2] = np.where(missing[:, 2], lowest, low)
+        values[:, 3] = np.where(missing[:, 3], first, close)
+        values[:, 4] = np.where(missing[:, 4], 0.0, volume)
+
+    """
+    Reads a CSV of klines into a DataFrame of Open, High, Low, Close and Volume,
+    indexed by minute. Rows outside of dateOfStart and dateOfEnd (where given) and
+    duplicate rows are dropped, NaNs are fixed and missing entries take the values
+    of the entry after them.
+    :param interval: the time between entries
+    :param dtype: the type of the values in the DataFrame
+    :return: the DataFrame, or None if the CSV couldn't be read
+    """
+    def _readKlineCsv(self, path: str, ticker: str, interval: timedelta, dateOfStart: datetime = None,
+                      dateOfEnd: datetime = None, dtype=np.float64) -> pd.DataFrame:
+        try:
+            # The whole file is parsed by pandas rather than row by row, with pyarrow's multithreaded parser if it is
+            # installed. Giving the types up front saves pandas from inferring them.
+            try:
+                data = pd.read_csv(path, usecols=list(_CSV_TYPES), dtype=_CSV_TYPES, engine="pyarrow")
+            except ImportError:
+                data = pd.read_csv(path, usecols=list(_CSV_TYPES), dtype=_CSV_TYPES)
+        except IOError as e:
+            print("Could not read " + path + "!")
+            return None
+
+        index = pd.DatetimeIndex(self._parseTimestamps(data["timestamp"], ticker), name="Timestamp")
+        # Sometimes, Binance data has duplicate entries for some reason. Those and the rows we don't want are dropped
+        # with one mask, so that each column is only copied once on its way into the DataFrame.
+        keep = index.notna() & ~index.duplicated()
+
+        if dateOfStart is not None:
+            keep &= index >= dateOfStart
+
+        if dateOfEnd is not None:
+            keep &= index <= dateOfEnd
+
+        values = np.empty((np.count_nonzero(keep), len(_CSV_COLUMNS)), dtype=dtype)
+
+        for i, csvColumn in enumerate(_CSV_COLUMNS.values()):
+            values[:, i] = data[csvColumn].to_numpy()[keep]
+
+        self._fixNans(values)
+        df = pd.DataFrame(values, index=index[keep], columns=list(_CSV_COLUMNS), copy=False)
+
+        if len(df) > 0:
+            # Missing entries take the values of the entry after them.
+            df = df.reindex(pd.date_range(df.index[0], df.index[-1], freq=interval, name="Timestamp"), method="bfill")
+
+        return df
+
+    """
+    Returns the position of the first entry of index at or after startTime and one
+    past the last entry at or before endTime, where a startTime or endTime of None
+    means the start or end of index.
+    :param index: sorted timestamps, as a DatetimeIndex or a datetime64 array
+    """
+    def _findBounds(self, index, startTime, endTime) -> Tuple[int, int]:
+        # Binary search rather than counting entries from the first timestamp, which breaks if an entry is missing.
+        # The times are searched for as nanosecond datetime64s, so that searching a datetime64[ns] array never has
+        # to convert the whole array.
+        start = 0 if startTime is None else int(index.searchsorted(np.datetime64(startTime, "ns"), side="left"))
+        end = len(index) if endTime is None else int(index.searchsorted(np.datetime64(endTime, "ns"), side="right"))
+        return start, end
+
+    """
+    Writes the values of column that aren't NaN into df's existing column of the
+    given name, like Series.update. Calling update on df[columnName] itself would
+    only change a copy with copy-on-write pandas.
+    """
+    def _updateColumn(self, df: pd.DataFrame, columnName: str, column: pd.Series):
+        if not df.index.equals(column.index):
+            df.update(column.rename(columnName).to_frame())
+            return
+
+        # The rows already line up, so there is nothing to align.
+        values = column.to_numpy()
+        missing = pd.isna(values)
+
+        if missing.any():
+            values = np.where(missing, df[columnName].to_numpy(), values)
+
+        df[columnName] = values.astype(df[columnName].dtype, copy=False)
+
+    """
+    Converts historical CSV timestamps, which are either year/month/day or
+    day-month-year followed by the hour and minute, to the minute they are in.
+    Timestamps without a minute, or that can't be read, become NaT.
+    """
+    def _parseTimestamps(self, timestamps: pd.Series, ticker: str) -> pd.Series:
+        first = timestamps.iloc[0] if len(timestamps) > 0 else None
+        timings = pd.Series(pd.NaT, index=timestamps.index, dtype="datetime64[ns]")
+
+        for format in _TIMESTAMP_FORMATS:
+            try:
+                datetime.strptime(first, format)
+            except (TypeError, ValueError):
+                continue
+
+            timings = pd.to_datetime(timestamps, format=format, errors="coerce").dt.floor("min")
+            break
+
+        unparsed = timings.isna()
+
+        if unparsed.any():
+            timings = timings.where(~unparsed, self._splitTimestamps(timestamps[unparsed], ticker))
+
+        return timings
+
+    def _splitTimestamps(self, timestamps: pd.Series, ticker: str) -> pd.Series:
+        times = timestamps.str.split(_TIMESTAMP_SEPARATORS, expand=True).reindex(columns=range(5))
+        hasMinute = times[4].notna()
+        times = times.apply(pd.to_numeric, errors="coerce")
+        yearFirst = timestamps.str.contains("/", regex=False)
+        timings = pd.to_datetime(pd.DataFrame({"year": times[0].where(yearFirst, times[2]), "month": times[1],
+                                               "day": times[2].where(yearFirst, times[0]), "hour": times[3],
+                                               "minute": times[4]}), errors="coerce")
+
+        for timestamp in timestamps[hasMinute & timings.isna()]:
+            print("Error reading historical timestamp " + str(timestamp) + " for " + ticker + ".")
+
+        return timings
@@ -6,27 +6,69 @@
 #              as clock passes. This class was taken from my PumpBot project and
 #              adapted for this project.
 
-import csv
+import hashlib
+import os
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import pandas as pd
-import re
 import numpy as np
 
-from clock.Clock import Clock
+import clock
 from data_obtaining.DataObtainer import DataObtainer
 
+try:
+    from numba import njit
+except ImportError:
+    # Without Numba, the kernels below just run as plain Python.
+    def njit(*args, **kwargs):
+        return lambda function: function
+
+
+# Intra-minute klines take their random numbers from a pool that is refilled this many at a time, rather than
+# drawing them one call at a time.
+_RANDOM_POOL_SIZE = 3 * 4096
+# How many (startTime, endTime) windows are remembered per ticker and period before they are forgotten.
+_SLICE_CACHE_SIZE = 1024
+
+
+@njit(cache=True)
+def _sampleIntraMinuteKline(open: float, high: float, low: float, close: float, openCloseRatios: np.ndarray,
+                            highRatios: np.ndarray, lowRatios: np.ndarray, randoms: np.ndarray, i: int):
+    """
+    Makes up a price, high and low so far within a minute by scaling its kline by randomly picked sample ratios.
+    :param randoms: uniform random numbers in [0, 1), of which the three starting at i are used
+    """
+    price = openCloseRatios[_randomIndex(randoms[i], len(openCloseRatios))] * (open + close) / 2
+    high = highRatios[_randomIndex(randoms[i + 1], len(highRatios))] * high
+    low = lowRatios[_randomIndex(randoms[i + 2], len(lowRatios))] * low
+    return price, high, low
+
+
+@njit(cache=True)
+def _randomIndex(random: float, length: int) -> int:
+    """
+    Maps a uniform random number in [0, 1) to an index into an array of the given length.
+    """
+    index = int(random * length)
+    # random * length can round up to length when random is just below 1.
+    return index - (index == length)
+
+
 class HistoricalDataObtainer(DataObtainer):
     dateOfStart: datetime
     dateOfEnd: datetime
     filePathPrefix: str
     timezone: str
 
-    # Pandas makes life easy but is very slow
+    # Pandas makes life easy but is very slow. The price and volume columns are float32 to halve the memory that
+    # every scan over them has to go through.
     _1MinDataAsDataFrames: Dict[str, pd.DataFrame]
     _1HourDataAsDataFrames: Dict[str, pd.DataFrame]
     _1DayDataAsDataFrames: Dict[str, pd.DataFrame]
     _1MinIntraMinuteDataAsDataFrames: Dict[str, pd.DataFrame]
+    # Maps (ticker, period) to the index of the ticker's DataFrame, its columns as arrays and the positions that
+    # (startTime, endTime) windows resolve to, so that repeated reads don't have to go through pandas.
+    _columnArrays: Dict[Tuple[str, str], Tuple[np.ndarray, Dict[str, np.ndarray], Dict[Tuple, Tuple[int, int]]]]
     _obtained: bool
 
     # For generating a random intra minute price
@@ -35,20 +77,27 @@ class HistoricalDataObtainer(DataObtainer):
     _lastIntraMinuteHigh: float
     _lastIntraMinuteLow: float
 
-    _intraMinuteOpenCloseSampleRatios: List
-    _intraMinuteHighSampleRatios: List
-    _intraMinuteLowSampleRatios: List
+    _intraMinuteOpenCloseSampleRatios: np.ndarray
+    _intraMinuteHighSampleRatios: np.ndarray
+    _intraMinuteLowSampleRatios: np.ndarray
 
     def __init__(self, dateOfStart: datetime, dateOfEnd: datetime, filePathPrefix="",
-                 intraMinuteDataPath="intra_minute_data/", intraMinuteBinanceDataPath="intra_minute_data/intra_minute_data_binance/"):
+                 intraMinuteDataPath="intra_minute_data/", intraMinuteBinanceDataPath="intra_minute_data/intra_minute_data_binance/",
+                 verbose=False, cacheDirectory=None):
+        """
+        :param cacheDirectory: if given, where parsed CSVs are saved as Parquet files (which needs pyarrow or
+                               fastparquet) so that later runs over the same dates don't have to parse them again
+        """
         self._1MinDataAsDataFrames = {}
         self._1HourDataAsDataFrames = {}
         self._1DayDataAsDataFrames = {}
         self._1MinIntraMinuteDataAsDataFrames = {}
+        self._columnArrays = {}
         self._obtained = False
         self.filePathPrefix = filePathPrefix
         self.dateOfStart = dateOfStart
         self.dateOfEnd = dateOfEnd
+        self.cacheDirectory = cacheDirectory
 
         # For Phemex intraminute data generation
         self._lastIntraMinuteTime = None
@@ -64,25 +113,20 @@ class HistoricalDataObtainer(DataObtainer):
         self._lastIntraMinuteBinancePrice = 0.0
         self._lastIntraMinuteBinanceHigh = 0.0
         self._lastIntraMinuteBinanceLow = 0.0
+        # The (tickerPair, minute) the last sampled intraminute kline was read for, and that kline
+        self._lastSampledIntraMinuteKey = None
+        self._lastSampledIntraMinuteKline = None
+        self._randomPool = np.random.random(_RANDOM_POOL_SIZE)
+        self._randomPoolPosition = 0
         self._intraMinuteBinanceOpenCloseSampleRatios = self._loadSampleData(intraMinuteBinanceDataPath + "open_close_ratios.csv")
         self._intraMinuteBinanceHighSampleRatios = self._loadSampleData(intraMinuteBinanceDataPath + "high_real_high_ratios.csv")
         self._intraMinuteBinanceLowSampleRatios = self._loadSampleData(intraMinuteBinanceDataPath + "low_real_low_ratios.csv")
 
-        n = 0
-
-        for x in self._intraMinuteHighSampleRatios:
-            if x >= 0.999999999:
-                n += 1
-
-        print("Num intra highs == high", n, "/", len(self._intraMinuteHighSampleRatios), n / len(self._intraMinuteHighSampleRatios))
-
-        n = 0
-
-        for x in self._intraMinuteLowSampleRatios:
-            if x <= 1.000000001:
-                n += 1
-
-        print("Num intra lows == low", n, "/", len(self._intraMinuteLowSampleRatios), n / len(self._intraMinuteLowSampleRatios))
+        if verbose:
+            n = np.count_nonzero(self._intraMinuteHighSampleRatios >= 0.999999999)
+            print("Num intra highs == high", n, "/", len(self._intraMinuteHighSampleRatios), n / len(self._intraMinuteHighSampleRatios))
+            n = np.count_nonzero(self._intraMinuteLowSampleRatios <= 1.000000001)
+            print("Num intra lows == low", n, "/", len(self._intraMinuteLowSampleRatios), n / len(self._intraMinuteLowSampleRatios))
 
     def trackTickers(self, tickerPairs: List[str]):
         """
@@ -94,6 +138,10 @@ class HistoricalDataObtainer(DataObtainer):
         for ticker in tickerPairs:
             self._readTickerPairData(ticker)
 
+        # Compile the sampling kernel now rather than on the first tick.
+        _sampleIntraMinuteKline(1.0, 1.0, 1.0, 1.0, self._intraMinuteBinanceOpenCloseSampleRatios,
+                                self._intraMinuteBinanceHighSampleRatios, self._intraMinuteBinanceLowSampleRatios,
+                                np.zeros(3), 0)
         self._obtained = True
 
     def stopTrackingTickers(self, tickerPairs: List[str]):
@@ -107,82 +155,99 @@ class HistoricalDataObtainer(DataObtainer):
             self._1MinDataAsDataFrames.pop(ticker)
             self._1HourDataAsDataFrames.pop(ticker)
             self._1DayDataAsDataFrames.pop(ticker)
+            self._1MinIntraMinuteDataAsDataFrames.pop(ticker, None)
+
+            for period in ["1m", "1h", "1d", "intraminute"]:
+                self._columnArrays.pop((ticker, period), None)
 
     def obtainMinuteValues(self, ticker: str, startTime=None, endTime=None, column=None):
-        df = self._1MinDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 60, column=column)
+        return self._filterByTime(ticker, "1m", startTime, endTime, column=column)
 
     def obtainHourValues(self, ticker: str, startTime=None, endTime=None, column=None):
-        df = self._1HourDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 3600, column=column)
+        return self._filterByTime(ticker, "1h", startTime, endTime, column=column)
 
     def obtainDayValues(self, ticker: str, startTime=None, endTime=None, column=None):
-        df = self._1DayDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 86400, column=column)
+        return self._filterByTime(ticker, "1d", startTime, endTime, column=column)
 
     # This is fast
     def obtainSingleColumnMinuteValues(self, ticker: str, column, startTime=None, endTime=None):
-        df = self._1MinDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 60)
+        return self._filterSingleColumnByTime(ticker, "1m", column, startTime, endTime)
 
     # This is fast
     def obtainSingleColumnHourValues(self, ticker: str, column, startTime=None, endTime=None):
-        df = self._1HourDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 3600)
+        return self._filterSingleColumnByTime(ticker, "1h", column, startTime, endTime)
 
     # This is fast
     def obtainSingleColumnDayValues(self, ticker: str, column, startTime=None, endTime=None):
-        df = self._1DayDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 86400)
+        return self._filterSingleColumnByTime(ticker, "1d", column, startTime, endTime)
 
     def addCustomMinuteColumn(self, ticker, columnName, column, updateExisting=True):
+        self._columnArrays.pop((ticker, "1m"), None)
+
         if updateExisting and columnName in self._1MinDataAsDataFrames[ticker].columns:
-            self._1MinDataAsDataFrames[ticker][columnName].update(column)
+            self._updateColumn(self._1MinDataAsDataFrames[ticker], columnName, column)
         else:
             self._1MinDataAsDataFrames[ticker][columnName] = column
 
     def addCustomHourColumn(self, ticker, columnName, column, updateExisting=True):
+        self._columnArrays.pop((ticker, "1h"), None)
+
         if updateExisting and columnName in self._1HourDataAsDataFrames[ticker].columns:
-            self._1HourDataAsDataFrames[ticker][columnName].update(column)
+            self._updateColumn(self._1HourDataAsDataFrames[ticker], columnName, column)
         else:
             self._1HourDataAsDataFrames[ticker][columnName] = column
 
     def addCustomDayColumn(self, ticker, columnName, column, updateExisting=True):
+        self._columnArrays.pop((ticker, "1d"), None)
+
         if updateExisting and columnName in self._1DayDataAsDataFrames[ticker].columns:
-            self._1DayDataAsDataFrames[ticker][columnName].update(column)
+            self._updateColumn(self._1DayDataAsDataFrames[ticker], columnName, column)
         else:
             self._1DayDataAsDataFrames[ticker][columnName] = column
 
     def updateMinuteEntry(self, ticker, columnName, timestamp, value):
-        self._1MinDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._columnArrays.pop((ticker, "1m"), None)
+        self._1MinDataAsDataFrames[ticker].at[timestamp, columnName] = value
 
     def updateHourEntry(self, ticker, columnName, timestamp, value):
-        self._1HourDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._columnArrays.pop((ticker, "1h"), None)
+        self._1HourDataAsDataFrames[ticker].at[timestamp, columnName] = value
 
     def updateDayEntry(self, ticker, columnName, timestamp, value):
-        self._1DayDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._columnArrays.pop((ticker, "1d"), None)
+        self._1DayDataAsDataFrames[ticker].at[timestamp, columnName] = value
 
     def addEmptyMinuteColumn(self, ticker, columnName, fillValue):
-        self._1MinDataAsDataFrames[ticker][columnName] = fillValue
+        self._columnArrays.pop((ticker, "1m"), None)
+        self._1MinDataAsDataFrames[ticker][columnName] = self._toColumnType(fillValue)
 
     def addEmptyHourColumn(self, ticker, columnName, fillValue):
-        self._1HourDataAsDataFrames[ticker][columnName] = fillValue
+        self._columnArrays.pop((ticker, "1h"), None)
+        self._1HourDataAsDataFrames[ticker][columnName] = self._toColumnType(fillValue)
 
     def addEmptyDayColumn(self, ticker, columnName, fillValue):
-        self._1DayDataAsDataFrames[ticker][columnName] = fillValue
+        self._columnArrays.pop((ticker, "1d"), None)
+        self._1DayDataAsDataFrames[ticker][columnName] = self._toColumnType(fillValue)
+
+    def _toColumnType(self, fillValue):
+        # Keep float columns as float32 like the rest of the DataFrame.
+        return np.float32(fillValue) if isinstance(fillValue, float) else fillValue
 
     def removeCustomMinuteColumn(self, ticker, columnName):
-        self._1MinDataAsDataFrames[ticker].drop(columns=[columnName])
+        self._columnArrays.pop((ticker, "1m"), None)
+        del self._1MinDataAsDataFrames[ticker][columnName]
 
     def removeCustomHourColumn(self, ticker, columnName):
-        self._1HourDataAsDataFrames[ticker].drop(columns=[columnName])
+        self._columnArrays.pop((ticker, "1h"), None)
+        del self._1HourDataAsDataFrames[ticker][columnName]
 
     def removeCustomDayColumn(self, ticker, columnName):
-        self._1DayDataAsDataFrames[ticker].drop(columns=[columnName])
+        self._columnArrays.pop((ticker, "1d"), None)
+        del self._1DayDataAsDataFrames[ticker][columnName]
 
     def getIntraMinuteKline(self, tickerPair, useSampledIntraMinuteData=False):
         return self.getIntraMinuteBinanceKline(tickerPair, useSampledIntraMinuteData=useSampledIntraMinuteData)
-        minute = Clock.getInstance().getMinuteTimestamp()
+        minute = clock.CLOCK.getMinuteTimestamp()
 
         if self._lastIntraMinuteTime == minute:
             return self._lastIntraMinutePrice, self._lastIntraMinuteHigh, self._lastIntraMinuteLow
@@ -203,39 +268,56 @@ class HistoricalDataObtainer(DataObtainer):
         return self._lastIntraMinutePrice, self._lastIntraMinuteHigh, self._lastIntraMinuteLow
 
     def getIntraMinuteBinanceKline(self, tickerPair, useSampledIntraMinuteData=False):
-        minute = Clock.getInstance().getMinuteTimestamp()
+        minute = clock.CLOCK.getMinuteTimestamp()
 
         if useSampledIntraMinuteData:
-            data = self._1MinIntraMinuteDataAsDataFrames[tickerPair].loc[minute]
-            return data["Close"], data["High"], data["Low"]
+            # Callers usually ask for the same minute several times in a row.
+            if self._lastSampledIntraMinuteKey != (tickerPair, minute):
+                i = self._getMinuteRow(tickerPair, "intraminute", minute)
+                self._lastSampledIntraMinuteKey = (tickerPair, minute)
+                self._lastSampledIntraMinuteKline = tuple(
+                    float(self._getColumnArray(tickerPair, "intraminute", column)[1][i])
+                    for column in ["Close", "High", "Low"])
+
+            return self._lastSampledIntraMinuteKline
 
         if self._lastIntraMinuteBinanceTime == minute:
             return self._lastIntraMinuteBinancePrice, self._lastIntraMinuteBinanceHigh, self._lastIntraMinuteBinanceLow
 
+        i = self._getMinuteRow(tickerPair, "1m", minute)
         self._lastIntraMinuteBinanceTime = minute
-        valuesMinutes = self.obtainMinuteValues(tickerPair, startTime=minute, endTime=minute)
-        midOpenClose = (valuesMinutes["Open"].iloc[0] + valuesMinutes["Close"].iloc[0]) / 2
-
-        self._lastIntraMinuteBinancePrice = self._intraMinuteBinanceOpenCloseSampleRatios[
-            int(min(np.random.uniform(), 0.99999) * len(self._intraMinuteBinanceOpenCloseSampleRatios))] \
-            * midOpenClose
-        self._lastIntraMinuteBinanceHigh = self._intraMinuteBinanceHighSampleRatios[
-            int(min(np.random.uniform(), 0.99999) * len(self._intraMinuteBinanceHighSampleRatios))] \
-            * valuesMinutes["High"].iloc[0]
-        self._lastIntraMinuteBinanceLow = self._intraMinuteBinanceLowSampleRatios[
-            int(min(np.random.uniform(), 0.99999) * len(self._intraMinuteBinanceLowSampleRatios))] \
-            * valuesMinutes["Low"].iloc[0]
+        open, high, low, close = [float(self._getColumnArray(tickerPair, "1m", column)[1][i])
+                                  for column in ["Open", "High", "Low", "Close"]]
+
+        if self._randomPoolPosition + 3 > len(self._randomPool):
+            self._randomPool = np.random.random(_RANDOM_POOL_SIZE)
+            self._randomPoolPosition = 0
+
+        self._lastIntraMinuteBinancePrice, self._lastIntraMinuteBinanceHigh, self._lastIntraMinuteBinanceLow = \
+            _sampleIntraMinuteKline(open, high, low, close, self._intraMinuteBinanceOpenCloseSampleRatios,
+                                    self._intraMinuteBinanceHighSampleRatios, self._intraMinuteBinanceLowSampleRatios,
+                                    self._randomPool, self._randomPoolPosition)
+        self._randomPoolPosition += 3
         return self._lastIntraMinuteBinancePrice, self._lastIntraMinuteBinanceHigh, self._lastIntraMinuteBinanceLow
 
-    def _loadSampleData(self, path):
-        values = []
-        file = open(path, "r")
+    def _getMinuteRow(self, tickerPair, period, minute) -> int:
+        """
+        :return: the row of a ticker's data for a period that is exactly at minute
+        :raises KeyError: if there is no row for minute
+        """
+        index, _ = self._getColumnArray(tickerPair, period, "Close")
+        timestamp = np.datetime64(minute, "ns")
+        i = index.searchsorted(timestamp)
+
+        # searchsorted gives where minute would go, which is the next row if minute itself is missing.
+        if i >= len(index) or index[i] != timestamp:
+            raise KeyError(minute)
 
-        for line in file.readlines():
-            values.append(float(line))
+        return i
 
-        file.close()
-        return values
+    def _loadSampleData(self, path) -> np.ndarray:
+        # The files have one ratio per line.
+        return np.loadtxt(path, dtype=np.float64, ndmin=1)
 
     """
     Reads ticker data_tools into self._dataAsDataFrames
@@ -246,80 +328,81 @@ class HistoricalDataObtainer(DataObtainer):
         self._readTickerDataHelper(tickerPair, "1d")
         self._readTickerDataHelper(tickerPair, "intraminute")
 
-    def _generateData(self, row, timing):
-        open = float(row["open"])
-        high = float(row["high"])
-        low = float(row["low"])
-        close = float(row["close"])
-        dicts = []
-        entries = []
-        trade = float(row["trades"])
-
-        d = {
-            "Timestamp": timing,
-            "Open": open,
-            "High": high,
-            "Low": low,
-            "Close": close,
-            "Volume": trade
-        }
-
-        dicts.append(d)
-        entries.append([timing, open, high, low, close, trade])
-        return entries, dicts
-
-    def _addAverage(self, ticker, period):
+    def _getDataFrames(self, period) -> Dict[str, pd.DataFrame]:
         if period == "1m":
-            df = self._1MinDataAsDataFrames[ticker]
+            return self._1MinDataAsDataFrames
         elif period == "1h":
-            df = self._1HourDataAsDataFrames[ticker]
+            return self._1HourDataAsDataFrames
+        elif period == "intraminute":
+            return self._1MinIntraMinuteDataAsDataFrames
         else:
-            df = self._1DayDataAsDataFrames[ticker]
+            return self._1DayDataAsDataFrames
 
-        df["Average"] = (df["High"] + df["Low"] + df["Close"]) / 3
-
-    def _filterByTime(self, df: pd.DataFrame, startTime, endTime, secondsBetweenEntries: int, column=None):
-        if startTime is None:
-            start = 0
-        else:
-            start = int((startTime - df.index[0]).total_seconds() // secondsBetweenEntries)
-
-        if endTime is None:
-            end = len(df)
-        else:
-            end = int((endTime - df.index[0]).total_seconds() // secondsBetweenEntries) + 1
+    def _filterByTime(self, ticker: str, period: str, startTime, endTime, column=None):
+        df = self._getDataFrames(period)[ticker]
+        start, end = self._resolveSlice(ticker, period, startTime, endTime)
 
         if column is not None:
             return df[column].iloc[start:end]
 
         return df.iloc[start:end]
 
-        # if column is not None:
-        #     return df.loc[startTime:endTime, column]
-        #
-        # return df.loc[startTime:endTime,]
+    def _filterSingleColumnByTime(self, ticker: str, period: str, column: str, startTime, endTime):
+        values = self._getColumnArray(ticker, period, column)[1]
+        start, end = self._resolveSlice(ticker, period, startTime, endTime)
+        x = values[start:end]
+        # This is a view of the cached column, so don't let callers change it underneath us.
+        x.flags.writeable = False
+        return x
 
-    def _filterSingleColumnByTime(self, df: pd.DataFrame, column: str, startTime, endTime, secondsBetweenEntries: int):
-        if startTime is None:
-            start = 0
-        else:
-            start = int((startTime - df.index[0]).total_seconds() // secondsBetweenEntries)
+    def _resolveSlice(self, ticker: str, period: str, startTime, endTime) -> Tuple[int, int]:
+        """
+        Returns the positions of the first entry at or after startTime and one past the last entry at or before
+        endTime. Strategies tend to ask for the same window several times per step (e.g. one for each indicator), so
+        these are remembered until the DataFrame changes.
+        """
+        cached = self._getCachedArrays(ticker, period)
+        slices = cached[2]
+        bounds = slices.get((startTime, endTime))
 
-        if endTime is None:
-            end = len(df)
-        else:
-            end = int((endTime - df.index[0]).total_seconds() // secondsBetweenEntries) + 1
+        if bounds is None:
+            bounds = self._findBounds(cached[0], startTime, endTime)
 
-        return df[column].values[start:end]
+            if len(slices) >= _SLICE_CACHE_SIZE:
+                slices.clear()
 
-    def _readTickerDataHelper(self, ticker, period):
-        listOfDicts = []
-        entries = []
+            slices[(startTime, endTime)] = bounds
+
+        return bounds
+
+    def _getColumnArray(self, ticker: str, period: str, column: str):
+        """
+        Returns the index of a ticker's DataFrame and one of its columns as arrays.
+        """
+        cached = self._getCachedArrays(ticker, period)
+        arrays = cached[1]
+
+        if column not in arrays:
+            arrays[column] = self._getDataFrames(period)[ticker][column].to_numpy()
 
+        return cached[0], arrays[column]
+
+    def _getCachedArrays(self, ticker: str, period: str):
+        """
+        Anything that changes a DataFrame must pop its entry from _columnArrays.
+        """
+        cached = self._columnArrays.get((ticker, period))
+
+        if cached is None:
+            # Timestamps are kept in nanoseconds whatever unit the DataFrame uses, so that searching them with a
+            # nanosecond key never has to convert the whole array.
+            cached = (self._getDataFrames(period)[ticker].index.values.astype("datetime64[ns]", copy=False), {}, {})
+            self._columnArrays[(ticker, period)] = cached
+
+        return cached
+
+    def _readTickerDataHelper(self, ticker, period):
         path = self.filePathPrefix + ticker + "-" + period + "-data.csv"
-        count = 0
-        numSamples = 0
-        previousTiming = None
 
         if period == "1m" or period == "intraminute":
             interval = timedelta(minutes=1)
@@ -329,80 +412,74 @@ class HistoricalDataObtainer(DataObtainer):
             # 1 day
             interval = timedelta(days=1)
 
+        cachePath = None
+
+        if self.cacheDirectory is not None:
+            # The CSV's full path goes into the name too, so that data sets from different places (e.g. different
+            # exchanges) sharing a cache directory don't overwrite each other's caches.
+            pathHash = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+            cachePath = os.path.join(self.cacheDirectory, ticker + "-" + period + "-"
+                                     + self.dateOfStart.strftime("%Y%m%d%H%M") + "-"
+                                     + self.dateOfEnd.strftime("%Y%m%d%H%M") + "-" + pathHash + ".parquet")
+
+        df = self._readCache(path, cachePath)
+
+        if df is None:
+            df = self._readKlineCsv(path, ticker, interval, dateOfStart=self.dateOfStart, dateOfEnd=self.dateOfEnd,
+                                    dtype=np.float32)
+
+            if df is None:
+                return
+
+            self._writeCache(df, cachePath)
+
+        # (High + Low + Close) / 3, worked out in one buffer rather than allocating a temporary for every operation.
+        high = df["High"].to_numpy()
+        average = np.empty_like(high)
+        np.add(high, df["Low"].to_numpy(), out=average)
+        np.add(average, df["Close"].to_numpy(), out=average)
+        np.multiply(average, np.float32(1 / 3), out=average)
+        df["Average"] = average
+
+        if period == "1m":
+            self._1MinDataAsDataFrames[ticker] = df
+        elif period == "1h":
+            self._1HourDataAsDataFrames[ticker] = df
+        elif period == "intraminute":
+            self._1MinIntraMinuteDataAsDataFrames[ticker] = df
+        else:
+            # 1 day
+            self._1DayDataAsDataFrames[ticker] = df
+
+        self._columnArrays.pop((ticker, period), None)
+        print("Done reading " + ticker + " historical data.")
+
+    def _readCache(self, path, cachePath):
+        """
+        :return: the DataFrame cached for a CSV, or None if there isn't one that is newer than the CSV
+        """
+        if cachePath is None:
+            return None
+
+        try:
+            if os.path.getmtime(cachePath) < os.path.getmtime(path):
+                return None
+
+            return pd.read_parquet(cachePath)
+        except Exception:
+            # The cache is only there to save time. If it is missing, unreadable or corrupt (e.g. a write was cut
+            # short), the CSV is parsed instead.
+            return None
+
+    def _writeCache(self, df, cachePath):
+        if cachePath is None:
+            return
+
         try:
-            with open(path, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                for row in reader:
-                    timestamp = row["timestamp"]
-                    times = re.split(r'[-/:\s]\s*', timestamp)
-
-                    if len(times) < 5:
-                        continue
-
-                    try:
-                        if "/" in timestamp:
-                            timing = datetime(int(times[0]), int(times[1]),
-                                              int(times[2]), int(times[3]),
-                                              int(times[4]))
-                        else:
-                            timing = datetime(int(times[2]), int(times[1]),
-                                              int(times[0]), int(times[3]),
-                                              int(times[4]))
-                    except:
-                        print("Error reading historical timestamp " + str(
-                            timestamp) + " for " + ticker + ".")
-                        continue
-
-                    if timing < self.dateOfStart:
-                        continue
-
-                    if timing > self.dateOfEnd:
-                        break
-
-                    if previousTiming == timing:
-                        # Sometimes, Binance data has duplicate entries for some reason.
-                        continue
-
-                    if previousTiming is not None and previousTiming + interval < timing:
-                        previousTiming += interval
-                        while previousTiming != timing:
-                            entries2, dicts = self._generateData(row, previousTiming)
-                            listOfDicts += dicts
-                            numSamples += 1
-                            entries += entries2
-                            count += 1
-                            previousTiming += interval
-
-                    previousTiming = timing
-                    entries2, dicts = self._generateData(row, timing)
-                    listOfDicts += dicts
-                    numSamples += 1
-                    entries += entries2
-                    count += 1
-
-                    if count == 10000:
-                        print("Read " + ticker + " data up to " + str(timing))
-                        count = 0
-
-            df = pd.DataFrame(entries, index=[i for i in range(numSamples)],
-                              columns=["Timestamp", "Open", "High", "Low",
-                                        "Close", "Volume"])
-            df = df.set_index("Timestamp")
-
-            if period == "1m":
-                self._1MinDataAsDataFrames[ticker] = df
-            elif period == "1h":
-                self._1HourDataAsDataFrames[ticker] = df
-            elif period == "intraminute":
-                self._1MinIntraMinuteDataAsDataFrames[ticker] = df
-            else:
-                # 1 day
-                self._1DayDataAsDataFrames[ticker] = df
-
-            self._addAverage(ticker, period)
-            print("Done reading " + ticker + " historical data.")
-
-        except IOError as e:
-            print("Could not read " + path + "!")
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+            df.to_parquet(cachePath, compression="zstd")
+        except ImportError:
+            print("Could not cache historical data since there is no Parquet engine installed.")
+        except OSError as e:
+            print("Could not cache historical data in " + cachePath + ": " + str(e))
 
@@ -3,15 +3,14 @@
 # Date: 14/08/2021
 # Description: Keeps track of historical stock prices from the Phemex exchange.
 
-import csv
 import json
 import math
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
-import re
 import pytz
 import time
 import hmac
@@ -21,11 +20,22 @@ from binance.client import Client
 import threading as th
 
 from connections.PhemexConnection import PhemexConnection
+from data_obtaining.ColumnArrays import ColumnArrays
 from data_obtaining.DataObtainer import DataObtainer
 from logger.Logger import Logger
 from util.Constants import PHEMEX_DATA_FETCH_ATTEMPT_AMOUNT
 from util.Datetime import roundDownToMinute
 
+try:
+    from orjson import loads as _loadJson
+except ImportError:
+    # Without orjson, responses are decoded by the standard library, just more slowly.
+    _loadJson = json.loads
+
+# Price requests are bound by network latency, so requests for different tickers are overlapped.
+_PRICE_FETCH_WORKERS = 16
+_PRICE_FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=_PRICE_FETCH_WORKERS)
+
 
 class PhemexDataObtainer(DataObtainer):
     dateOfStart: datetime
@@ -34,10 +44,18 @@ class PhemexDataObtainer(DataObtainer):
     binanceClient: Client
     phemexConnection: PhemexConnection
     propertiesFile: str
+    # The contents of propertiesFile, once they have been read
+    _properties: Dict
 
     _1MinDataAsDataFrames: Dict[str, pd.DataFrame]
     _1HourDataAsDataFrames: Dict[str, pd.DataFrame]
     _1DayDataAsDataFrames: Dict[str, pd.DataFrame]
+    # Rows added since the DataFrames were last built, so that addRow doesn't copy a whole DataFrame per kline.
+    _1MinPendingRows: Dict[str, List[Dict]]
+    _1HourPendingRows: Dict[str, List[Dict]]
+    _1DayPendingRows: Dict[str, List[Dict]]
+    # Maps (ticker, period) to the ticker's index and columns as arrays.
+    _columnArrays: Dict[Tuple[str, str], ColumnArrays]
     _obtained: bool
     _id: str
     _phemexAPIKey: str
@@ -45,7 +63,12 @@ class PhemexDataObtainer(DataObtainer):
     _obtainedMinuteHistoricalPhemexKlines: bool
     _obtainedHourHistoricalPhemexKlines: bool
     _obtainedDayHistoricalPhemexKlines: bool
-    _phemexDataLock: th.Lock
+    _phemexDataLock: th.RLock
+    _newData: th.Condition
+    # Keeps connections to Phemex open between requests.
+    _session: requests.Session
+    # An HMAC keyed with the API secret, copied for every signature
+    _signer: hmac.HMAC
 
     _onNewMinute: List
     _onNewHour: List
@@ -53,18 +76,28 @@ class PhemexDataObtainer(DataObtainer):
 
     def __init__(self, dateOfStart: datetime, propertiesFile: str, logger: Logger, filePathPrefix=""):
         self.propertiesFile = propertiesFile
+        self._properties = None
         self._1MinDataAsDataFrames = {}
         self._1HourDataAsDataFrames = {}
         self._1DayDataAsDataFrames = {}
+        self._1MinPendingRows = {}
+        self._1HourPendingRows = {}
+        self._1DayPendingRows = {}
+        self._columnArrays = {}
         self._obtained = False
         self._id = ""
         self._phemexAPIKey = ""
         self._phemexAPISecretKey = ""
+        self._session = requests.Session()
+        self._signer = None
         self._tryAmount = PHEMEX_DATA_FETCH_ATTEMPT_AMOUNT
         self._obtainedMinuteHistoricalPhemexKlines = False
         self._obtainedHourHistoricalPhemexKlines = False
         self._obtainedDayHistoricalPhemexKlines = False
-        self._phemexDataLock = th.Lock()
+        # Reentrant since reads flush pending rows under it, including reads that already hold it.
+        self._phemexDataLock = th.RLock()
+        # Notified whenever rows are added, so that the waitFor* methods don't have to poll.
+        self._newData = th.Condition(self._phemexDataLock)
 
         self.filePathPrefix = filePathPrefix
         self.dateOfStart = dateOfStart
@@ -83,12 +116,16 @@ class PhemexDataObtainer(DataObtainer):
 
     def usePhemexKeysFromFile(self):
         try:
-            with open(self.propertiesFile) as f:
-                data = json.load(f)
-                self._id = data["ID"]
-                self._phemexAPIKey = data["API key"]
-                self._phemexAPISecretKey = data["API secret"]
-        except:
+            # The file is only read the first time.
+            if self._properties is None:
+                with open(self.propertiesFile) as f:
+                    self._properties = json.load(f)
+
+            self._id = self._properties["ID"]
+            self._phemexAPIKey = self._properties["API key"]
+            self._phemexAPISecretKey = self._properties["API secret"]
+            self._signer = None
+        except (OSError, ValueError, KeyError):
             print(
                 "You are missing " + self.propertiesFile + ". Please ask Robert " \
                                                       "(robert.ciborowski"
@@ -122,6 +159,9 @@ class PhemexDataObtainer(DataObtainer):
                 self._1HourDataAsDataFrames[ticker] = self._1HourDataAsDataFrames[ticker].set_index("Timestamp")
                 self._1DayDataAsDataFrames[ticker] = pd.DataFrame(columns=["Timestamp", "Open", "High", "Low", "Close", "Volume", "Average"])
                 self._1DayDataAsDataFrames[ticker] = self._1DayDataAsDataFrames[ticker].set_index("Timestamp")
+                self._1MinPendingRows[ticker] = []
+                self._1HourPendingRows[ticker] = []
+                self._1DayPendingRows[ticker] = []
                 # self._readHistoricalTickerPairData(ticker)
 
         self._obtained = True
@@ -138,6 +178,12 @@ class PhemexDataObtainer(DataObtainer):
                 self._1MinDataAsDataFrames.pop(ticker)
                 self._1HourDataAsDataFrames.pop(ticker)
                 self._1DayDataAsDataFrames.pop(ticker)
+                self._1MinPendingRows.pop(ticker)
+                self._1HourPendingRows.pop(ticker)
+                self._1DayPendingRows.pop(ticker)
+
+                for period in ["1m", "1h", "1d"]:
+                    self._columnArrays.pop((ticker, period), None)
 
     def obtainMinuteValues(self, ticker: str, startTime=None, endTime=None, column=None, safeMode=False):
         if safeMode:
@@ -148,11 +194,13 @@ class PhemexDataObtainer(DataObtainer):
                 return None
 
             with self._phemexDataLock:
+                self._flushPending(ticker, "1m")
                 df = self._1MinDataAsDataFrames[ticker]
-                return self._filterByTime(df, startTime, endTime, 60, column=column)
+                return self._filterByTime(df, startTime, endTime, column=column)
 
+        self._flushPending(ticker, "1m")
         df = self._1MinDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 60, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     def obtainHourValues(self, ticker: str, startTime=None, endTime=None, column=None, safeMode=False):
         if safeMode:
@@ -163,11 +211,13 @@ class PhemexDataObtainer(DataObtainer):
                 return None
 
             with self._phemexDataLock:
+                self._flushPending(ticker, "1h")
                 df = self._1HourDataAsDataFrames[ticker]
-                return self._filterByTime(df, startTime, endTime, 3600, column=column)
+                return self._filterByTime(df, startTime, endTime, column=column)
 
+        self._flushPending(ticker, "1h")
         df = self._1HourDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 3600, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     def obtainDayValues(self, ticker: str, startTime=None, endTime=None, column=None, safeMode=False):
         if safeMode:
@@ -178,11 +228,13 @@ class PhemexDataObtainer(DataObtainer):
                 return None
 
             with self._phemexDataLock:
+                self._flushPending(ticker, "1d")
                 df = self._1DayDataAsDataFrames[ticker]
-                return self._filterByTime(df, startTime, endTime, 86400, column=column)
+                return self._filterByTime(df, startTime, endTime, column=column)
 
+        self._flushPending(ticker, "1d")
         df = self._1DayDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 86400, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     # This is fast
     def obtainSingleColumnMinuteValues(self, ticker: str, column, startTime=None, endTime=None, safeMode=False):
@@ -194,11 +246,11 @@ class PhemexDataObtainer(DataObtainer):
                 return None
 
             with self._phemexDataLock:
-                df = self._1MinDataAsDataFrames[ticker]
-                return self._filterSingleColumnByTime(df, column, startTime, endTime, 60)
+                self._flushPending(ticker, "1m")
+                return self._filterSingleColumnByTime(ticker, "1m", column, startTime, endTime)
 
-        df = self._1MinDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 60)
+        self._flushPending(ticker, "1m")
+        return self._filterSingleColumnByTime(ticker, "1m", column, startTime, endTime)
 
     # This is fast
     def obtainSingleColumnHourValues(self, ticker: str, column, startTime=None, endTime=None, safeMode=False):
@@ -210,11 +262,11 @@ class PhemexDataObtainer(DataObtainer):
                 return None
 
             with self._phemexDataLock:
-                df = self._1HourDataAsDataFrames[ticker]
-                return self._filterSingleColumnByTime(df, column, startTime, endTime, 3600)
+                self._flushPending(ticker, "1h")
+                return self._filterSingleColumnByTime(ticker, "1h", column, startTime, endTime)
 
-        df = self._1HourDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 3600)
+        self._flushPending(ticker, "1h")
+        return self._filterSingleColumnByTime(ticker, "1h", column, startTime, endTime)
 
     # This is fast
     def obtainSingleColumnDayValues(self, ticker: str, column, startTime=None, endTime=None, safeMode=False):
@@ -226,65 +278,71 @@ class PhemexDataObtainer(DataObtainer):
                 return None
 
             with self._phemexDataLock:
-                df = self._1DayDataAsDataFrames[ticker]
-                return self._filterSingleColumnByTime(df, column, startTime, endTime, 86400)
+                self._flushPending(ticker, "1d")
+                return self._filterSingleColumnByTime(ticker, "1d", column, startTime, endTime)
 
-        df = self._1DayDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 86400)
+        self._flushPending(ticker, "1d")
+        return self._filterSingleColumnByTime(ticker, "1d", column, startTime, endTime)
 
     def addCustomMinuteColumn(self, ticker, columnName, column, updateExisting=True):
-        # with self._phemexDataLock:
-        if updateExisting and columnName in self._1MinDataAsDataFrames[ticker].columns:
-            self._1MinDataAsDataFrames[ticker][columnName].update(column)
-        else:
-            self._1MinDataAsDataFrames[ticker][columnName] = column
+        self._addCustomColumn(ticker, columnName, column, "1m", updateExisting)
 
     def addCustomHourColumn(self, ticker, columnName, column, updateExisting=True):
-        # with self._phemexDataLock:
-        if updateExisting and columnName in self._1HourDataAsDataFrames[ticker].columns:
-            self._1HourDataAsDataFrames[ticker][columnName].update(column)
-        else:
-            self._1HourDataAsDataFrames[ticker][columnName] = column
+        self._addCustomColumn(ticker, columnName, column, "1h", updateExisting)
 
     def addCustomDayColumn(self, ticker, columnName, column, updateExisting=True):
-        # with self._phemexDataLock:
-        if updateExisting and columnName in self._1DayDataAsDataFrames[ticker].columns:
-            self._1DayDataAsDataFrames[ticker][columnName].update(column)
-        else:
-            self._1DayDataAsDataFrames[ticker][columnName] = column
+        self._addCustomColumn(ticker, columnName, column, "1d", updateExisting)
 
     def updateMinuteEntry(self, ticker, columnName, timestamp, value):
-        self._1MinDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._getDataFrameToChange(ticker, "1m").at[timestamp, columnName] = value
 
     def updateHourEntry(self, ticker, columnName, timestamp, value):
-        self._1HourDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._getDataFrameToChange(ticker, "1h").at[timestamp, columnName] = value
 
     def updateDayEntry(self, ticker, columnName, timestamp, value):
-        self._1DayDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._getDataFrameToChange(ticker, "1d").at[timestamp, columnName] = value
 
     def addEmptyMinuteColumn(self, ticker, columnName, fillValue):
         # with self._phemexDataLock:
-        self._1MinDataAsDataFrames[ticker][columnName] = fillValue
+        self._getDataFrameToChange(ticker, "1m")[columnName] = fillValue
 
     def addEmptyHourColumn(self, ticker, columnName, fillValue):
         # with self._phemexDataLock:
-        self._1HourDataAsDataFrames[ticker][columnName] = fillValue
+        self._getDataFrameToChange(ticker, "1h")[columnName] = fillValue
 
     def addEmptyDayColumn(self, ticker, columnName, fillValue):
         # with self._phemexDataLock:
-        self._1DayDataAsDataFrames[ticker][columnName] = fillValue
+        self._getDataFrameToChange(ticker, "1d")[columnName] = fillValue
 
     def removeCustomMinuteColumn(self, ticker, columnName):
         # with self._phemexDataLock:
-        self._1MinDataAsDataFrames[ticker].drop(columns=[columnName])
+        del self._getDataFrameToChange(ticker, "1m")[columnName]
 
     def removeCustomHourColumn(self, ticker, columnName):
         # with self._phemexDataLock:
-        self._1HourDataAsDataFrames[ticker].drop(columns=[columnName])
+        del self._getDataFrameToChange(ticker, "1h")[columnName]
 
     def removeCustomDayColumn(self, ticker, columnName):
         # with self._phemexDataLock:
-        self._1DayDataAsDataFrames[ticker].drop(columns=[columnName])
+        del self._getDataFrameToChange(ticker, "1d")[columnName]
+
+    def _addCustomColumn(self, ticker, columnName, column, period, updateExisting):
+        # with self._phemexDataLock:
+        df = self._getDataFrameToChange(ticker, period)
+
+        if updateExisting and columnName in df.columns:
+            self._updateColumn(df, columnName, column)
+        else:
+            df[columnName] = column
+
+    def _getDataFrameToChange(self, ticker, period) -> pd.DataFrame:
+        """
+        Returns a ticker's DataFrame with its pending rows flushed into it, for changing in place.
+        """
+        self._flushPending(ticker, period)
+        self._columnArrays.pop((ticker, period), None)
+        dataFrames, _, _ = self._getPeriodData(period)
+        return dataFrames[ticker]
 
     def runOnNewMinute(self, func):
         self._onNewMinute.append(func)
@@ -298,100 +356,115 @@ class PhemexDataObtainer(DataObtainer):
     def addRow(self, tickerPair, timestamp, open, high, low, close, volume, period="1m"):
         open, high, low, close, volume = self._fixNan(open, high, low, close, volume)
 
-        average = (high + low + close) / 3
-        data = [[timestamp, open, high, low, close, volume, average]]
+        row = {"Timestamp": timestamp, "Open": open, "High": high, "Low": low, "Close": close, "Volume": volume}
+        dataFrames, pendingRows, callbacks = self._getPeriodData(period)
+        df = dataFrames[tickerPair]
+        pending = pendingRows[tickerPair]
 
-        data = pd.DataFrame(data, index=[0], columns=["Timestamp", "Open", "High", "Low", "Close", "Volume", "Average"])
-        data = data.set_index("Timestamp")
+        if len(pending) > 0 and pending[-1]["Timestamp"] == timestamp:
+            pending[-1] = row
+        elif timestamp in df.index:
+            # Overwrite the row in place rather than building a DataFrame just to update the DataFrame with.
+            for column in ["Open", "High", "Low", "Close", "Volume"]:
+                df.at[timestamp, column] = row[column]
 
-        if period == "1m":
-            # print("addRow 1", timestamp, type(data["Open"]), type(open), open, end="")
-            if timestamp in self._1MinDataAsDataFrames[tickerPair].index:
-                self._1MinDataAsDataFrames[tickerPair].update(data)
+            df.at[timestamp, "Average"] = (high + low + close) / 3
+            self._columnArrays.pop((tickerPair, period), None)
+        else:
+            columns = ["Open", "High", "Low", "Close", "Volume"]
+
+            if len(pending) > 0:
+                last = pending[-1]
+                self._logRow(period, last["Timestamp"], *[last[column] for column in columns])
+            elif len(df) > 0:
+                self._logRow(period, df.index[-1], *[df[column].iat[-1] for column in columns])
             else:
-                columns = ["Open", "High", "Low", "Close", "Volume"]
-
-                if len(self._1MinDataAsDataFrames[tickerPair]) > 0:
-                    line = str(self._1MinDataAsDataFrames[tickerPair].iloc[-1][columns].values) \
-                        .replace("\n", " ").replace("[", "").replace("]", "")
-                    line = re.sub(" +", " ", line)
-                    line = str(self._1MinDataAsDataFrames[tickerPair].index[-1]).replace(":", "/")\
-                           .replace("-", "/") + "," + line.replace(" ", ",")
-                    self.phemexConnection.logger.writeSecondary("price_data_1m", line)
-                else:
-                    # We are here when we are getting historical data at the beginning of the bot runtime.
-                    for timestamp, row in data.iterrows():
-                        line = str(row[columns].values).replace("\n", " ").replace("[", "")\
-                            .replace("]", "")
-                        line = re.sub(" +", " ", line)
-                        line = str(timestamp).replace(":", "/").replace("-", "/") \
-                               + "," + line.replace(" ", ",")
-                        self.phemexConnection.logger.writeSecondary("price_data_1m", line)
+                # We are here when we are getting historical data at the beginning of the bot runtime.
+                self._logRow(period, timestamp, open, high, low, close, volume)
+
+            pending.append(row)
 
-                self._1MinDataAsDataFrames[tickerPair] = pd.concat([self._1MinDataAsDataFrames[tickerPair], data], sort=True)
+        with self._newData:
+            self._newData.notify_all()
 
-            # print("addRow 2", end="")
+        for func in callbacks:
+            func(timestamp)
 
-            for func in self._onNewMinute:
-                # print("onNewMinue", func, end="")
-                func(timestamp)
+    def _logRow(self, period, timestamp, open, high, low, close, volume):
+        line = f"{timestamp:%Y/%m/%d %H/%M/%S},{open},{high},{low},{close},{volume}"
+        self.phemexConnection.logger.writeSecondary("price_data_" + period, line)
 
-            # print("addRow 3", end="")
+    def _getPeriodData(self, period):
+        """
+        :return: the DataFrames, pending rows and new row callbacks of a period
+        """
+        if period == "1m":
+            return self._1MinDataAsDataFrames, self._1MinPendingRows, self._onNewMinute
         elif period == "1h":
-            if timestamp in self._1HourDataAsDataFrames[tickerPair].index:
-                self._1HourDataAsDataFrames[tickerPair].update(data)
-            else:
-                columns = ["Open", "High", "Low", "Close", "Volume"]
-
-                if len(self._1HourDataAsDataFrames[tickerPair]) > 0:
-                    line = str(self._1HourDataAsDataFrames[tickerPair].iloc[-1][columns].values) \
-                        .replace("\n", " ").replace("[", "").replace("]", "")
-                    line = re.sub(" +", " ", line)
-                    line = str(self._1HourDataAsDataFrames[tickerPair].index[-1]).replace(":", "/") \
-                               .replace("-", "/") + "," + line.replace(" ", ",")
-                    self.phemexConnection.logger.writeSecondary("price_data_1h", line)
-                else:
-                    # We are here when we are getting historical data at the beginning of the bot runtime.
-                    for timestamp, row in data.iterrows():
-                        line = str(row[columns].values).replace("\n", " ").replace("[", "") \
-                            .replace("]", "")
-                        line = re.sub(" +", " ", line)
-                        line = str(timestamp).replace(":", "/").replace("-", "/") \
-                               + "," + line.replace(" ", ",")
-                        self.phemexConnection.logger.writeSecondary("price_data_1h", line)
-
-                self._1HourDataAsDataFrames[tickerPair] = pd.concat([self._1HourDataAsDataFrames[tickerPair], data], sort=True)
-
-            for func in self._onNewHour:
-                func(timestamp)
+            return self._1HourDataAsDataFrames, self._1HourPendingRows, self._onNewHour
         else:
-            # 1 day
-            if timestamp in self._1DayDataAsDataFrames[tickerPair].index:
-                self._1DayDataAsDataFrames[tickerPair].update(data)
-            else:
-                columns = ["Open", "High", "Low", "Close", "Volume"]
-
-                if len(self._1DayDataAsDataFrames[tickerPair]) > 0:
-                    line = str(self._1DayDataAsDataFrames[tickerPair].iloc[-1][columns].values) \
-                        .replace("\n", " ").replace("[", "").replace("]", "")
-                    line = re.sub(" +", " ", line)
-                    line = str(self._1DayDataAsDataFrames[tickerPair].index[-1]).replace(":", "/") \
-                               .replace("-", "/") + "," + line.replace(" ", ",")
-                    self.phemexConnection.logger.writeSecondary("price_data_1d", line)
-                else:
-                    # We are here when we are getting historical data at the beginning of the bot runtime.
-                    for timestamp, row in data.iterrows():
-                        line = str(row[columns].values).replace("\n", " ").replace("[", "") \
-                            .replace("]", "")
-                        line = re.sub(" +", " ", line)
-                        line = str(timestamp).replace(":", "/").replace("-", "/") \
-                               + "," + line.replace(" ", ",")
-                        self.phemexConnection.logger.writeSecondary("price_data_1d", line)
-
-                self._1DayDataAsDataFrames[tickerPair] = pd.concat([self._1DayDataAsDataFrames[tickerPair], data], sort=True)
-
-            for func in self._onNewDay:
-                func(timestamp)
+            return self._1DayDataAsDataFrames, self._1DayPendingRows, self._onNewDay
+
+    def _flushPending(self, ticker, period):
+        """
+        Adds the rows that addRow buffered to the ticker's DataFrame, all in one concat.
+        """
+        dataFrames, pendingRows, _ = self._getPeriodData(period)
+
+        with self._phemexDataLock:
+            pending = pendingRows[ticker]
+
+            if len(pending) == 0:
+                return
+
+            old = dataFrames[ticker]
+            dataFrames[ticker] = pd.concat([old, self._rowsToDataFrame(pending)], sort=True)
+            pendingRows[ticker] = []
+            cached = self._columnArrays.get((ticker, period))
+
+            if cached is not None and cached.df is old:
+                cached.append(dataFrames[ticker])
+
+    def _copyLastRow(self, ticker, timestamp, period):
+        """
+        Fills in a kline that Phemex didn't send us with a copy of the one before it.
+        """
+        dataFrames, pendingRows, _ = self._getPeriodData(period)
+        df = dataFrames[ticker]
+        pending = pendingRows[ticker]
+
+        if len(pending) > 0:
+            last = pending[-1]
+        elif len(df) > 0:
+            last = {column: df[column].iat[-1] for column in ["Open", "High", "Low", "Close", "Volume"]}
+            last["Timestamp"] = df.index[-1]
+        else:
+            return
+
+        # Only add it to the end, rather than overwriting a row that we already have.
+        if timestamp > last["Timestamp"]:
+            pending.append(dict(last, Timestamp=timestamp))
+
+            with self._newData:
+                self._newData.notify_all()
+
+    def _rowsToDataFrame(self, rows):
+        """
+        Builds a DataFrame out of rows from addRow, working out their averages all at once.
+        """
+        df = pd.DataFrame(rows).set_index("Timestamp")
+        df["Average"] = (df["High"].to_numpy() + df["Low"].to_numpy() + df["Close"].to_numpy()) / 3
+        return df
+
+    def _getLastTimestamp(self, ticker, period):
+        dataFrames, pendingRows, _ = self._getPeriodData(period)
+        pending = pendingRows[ticker]
+
+        if len(pending) > 0:
+            return pending[-1]["Timestamp"]
+
+        return dataFrames[ticker].index[-1]
+
     """
     Reads ticker data_tools into self._dataAsDataFrames
     """
@@ -401,81 +474,41 @@ class PhemexDataObtainer(DataObtainer):
             self._readTickerDataHelper(tickerPair, "1h")
             self._readTickerDataHelper(tickerPair, "1d")
 
-    def _generateData(self, row, timing):
-        open = float(row["open"])
-        high = float(row["high"])
-        low = float(row["low"])
-        close = float(row["close"])
-        dicts = []
-        entries = []
-        trade = float(row["trades"])
-
-        d = {
-            "Timestamp": timing,
-            "Open": open,
-            "High": high,
-            "Low": low,
-            "Close": close,
-            "Volume": trade
-        }
-
-        dicts.append(d)
-        entries.append([timing, open, high, low, close, trade])
-        return entries, dicts
-
-    def _addAverage(self, ticker, period):
-        if period == "1m":
-            df = self._1MinDataAsDataFrames[ticker]
-        elif period == "1h":
-            df = self._1HourDataAsDataFrames[ticker]
-        else:
-            df = self._1DayDataAsDataFrames[ticker]
-
-        df["Average"] = (df["High"] + df["Low"] + df["Close"]) / 3
-
-    def _filterByTime(self, df: pd.DataFrame, startTime, endTime, secondsBetweenEntries: int, column=None):
-        if startTime is None:
-            start = 0
-        else:
-            start = max(0, int((startTime - df.index[0]).total_seconds() // secondsBetweenEntries))
-
-        if endTime is None:
-            end = len(df)
-        else:
-            end = max(0, int((endTime - df.index[0]).total_seconds() // secondsBetweenEntries)) + 1
+    def _filterByTime(self, df: pd.DataFrame, startTime, endTime, column=None):
+        start, end = self._findBounds(df.index, startTime, endTime)
 
         if column is not None:
             return df[column].iloc[start:end]
 
         return df.iloc[start:end]
 
-    def _filterSingleColumnByTime(self, df: pd.DataFrame, column: str, startTime, endTime, secondsBetweenEntries: int):
-        if startTime is None:
-            start = 0
-        else:
-            start = max(0, int((startTime - df.index[0]).total_seconds() // secondsBetweenEntries))
-
-        if endTime is None:
-            end = len(df)
-        else:
-            end = max(0, int((endTime - df.index[0]).total_seconds() // secondsBetweenEntries)) + 1
+    def _filterSingleColumnByTime(self, ticker: str, period: str, column: str, startTime, endTime):
+        index, values = self._getColumnArray(ticker, period, column)
+        start, end = self._findBounds(index, startTime, endTime)
+        x = values[start:end]
+        # This is a view of the cached column, so don't let callers change it underneath us.
+        x.flags.writeable = False
+        return x
 
-        x = df[column].values[start:end]
+    def _getColumnArray(self, ticker: str, period: str, column: str):
+        """
+        Returns the index of a ticker's DataFrame and one of its columns as arrays. These are cached since reading a
+        column through the DataFrame builds a Series every time, and _flushPending appends new rows to them. Anything
+        else that changes a DataFrame in place must pop its entry from _columnArrays, while replaced DataFrames are
+        noticed here.
+        """
+        dataFrames, _, _ = self._getPeriodData(period)
+        df = dataFrames[ticker]
+        cached = self._columnArrays.get((ticker, period))
 
-        if len(x) == 0:
-            print("UH OH", start, end, startTime, endTime, df.index[0])
-            print(df.tail)
+        if cached is None or cached.df is not df:
+            cached = ColumnArrays(df)
+            self._columnArrays[(ticker, period)] = cached
 
-        return x
+        return cached.index[:cached.length], cached.getColumn(column)
 
     def _readTickerDataHelper(self, ticker, period):
-        listOfDicts = []
-        entries = []
-
         path = self.filePathPrefix + ticker + "-" + period + "-data.csv"
-        count = 0
-        numSamples = 0
-        previousTiming = None
 
         if period == "1m":
             interval = timedelta(minutes=1)
@@ -485,77 +518,23 @@ class PhemexDataObtainer(DataObtainer):
             # 1 day
             interval = timedelta(days=1)
 
-        try:
-            with open(path, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                for row in reader:
-                    timestamp = row["timestamp"]
-                    times = re.split(r'[-/:\s]\s*', timestamp)
+        df = self._readKlineCsv(path, ticker, interval, dateOfStart=self.dateOfStart)
 
-                    if len(times) < 5:
-                        continue
+        if df is None:
+            return
 
-                    try:
-                        if "/" in timestamp:
-                            timing = datetime(int(times[0]), int(times[1]),
-                                              int(times[2]), int(times[3]),
-                                              int(times[4]))
-                        else:
-                            timing = datetime(int(times[2]), int(times[1]),
-                                              int(times[0]), int(times[3]),
-                                              int(times[4]))
-                    except:
-                        print("Error reading historical timestamp " + str(
-                            timestamp) + " for " + ticker + ".")
-                        continue
-
-                    if timing < self.dateOfStart:
-                        continue
-
-                    if previousTiming == timing:
-                        # Sometimes, Binance data has duplicate entries for some reason.
-                        continue
-
-                    if previousTiming is not None and previousTiming + interval < timing:
-                        previousTiming += interval
-                        while previousTiming != timing:
-                            entries2, dicts = self._generateData(row, previousTiming)
-                            listOfDicts += dicts
-                            numSamples += 1
-                            entries += entries2
-                            count += 1
-                            previousTiming += interval
-
-                    previousTiming = timing
-                    entries2, dicts = self._generateData(row, timing)
-                    listOfDicts += dicts
-                    numSamples += 1
-                    entries += entries2
-                    count += 1
-
-                    if count == 10000:
-                        print("Read " + ticker + " data up to " + str(timing))
-                        count = 0
-
-            df = pd.DataFrame(entries, index=[i for i in range(numSamples)],
-                              columns=["Timestamp", "Open", "High", "Low",
-                                       "Close", "Volume"])
-            df = df.set_index("Timestamp")
-
-            if period == "1m":
-                self._1MinDataAsDataFrames[ticker] = df
-            elif period == "1h":
-                self._1HourDataAsDataFrames[ticker] = df
-            else:
-                # 1 day
-                self._1DayDataAsDataFrames[ticker] = df
+        df["Average"] = (df["High"].to_numpy() + df["Low"].to_numpy() + df["Close"].to_numpy()) / 3
 
-            self._addAverage(ticker, period)
-            print("Done reading " + ticker + " historical data.")
+        if period == "1m":
+            self._1MinDataAsDataFrames[ticker] = df
+        elif period == "1h":
+            self._1HourDataAsDataFrames[ticker] = df
+        else:
+            # 1 day
+            self._1DayDataAsDataFrames[ticker] = df
 
-        except IOError as e:
-            print("Could not read " + path + "!")
+        self._getPeriodData(period)[1][ticker] = []
+        print("Done reading " + ticker + " historical data.")
 
     def _getHistoricalKlines(self, symbol, klineSize, startTime, endTime):
         klines = self.binanceClient.get_historical_klines(symbol, klineSize, startTime.strftime("%d %b %Y %H:%M:%S"),
@@ -574,19 +553,17 @@ class PhemexDataObtainer(DataObtainer):
                 # uri = "/spot/wallets?currency=" + ticker
                 seconds_since_epoch = int(time.time())
                 expiry = str(seconds_since_epoch + 60)
-                signature = hmac.new(bytes(self._phemexAPISecretKey, "utf-8"),
-                                     msg=bytes("/md/spot/ticker/24hrsymbol=s" + ticker + expiry, "utf-8"),
-                                     digestmod=hashlib.sha256).hexdigest()
+                signature = self._sign("/md/spot/ticker/24hrsymbol=s" + ticker + expiry)
                 headers = {
                     "x-phemex-access-token": self._phemexAPIKey,
                     "x-phemex-request-expiry": expiry,
                     "x-phemex-request-signature": signature
                 }
 
-                response = requests.get("https://api.phemex.com" + uri, headers=headers)
-                data = response.json()
+                response = self._session.get("https://api.phemex.com" + uri, headers=headers, timeout=10)
+                data = _loadJson(response.content)
 
-                if data["error"] != None:
+                if data.get("error") is not None:
                     print("getBalance failed to work for " + ticker + "! Not owned currency?")
                     break
 
@@ -596,20 +573,36 @@ class PhemexDataObtainer(DataObtainer):
                     "getBalance failed to work for " + ticker + "! ReadTimeout. Trying " + str(
                         self._tryAmount - 1 - i) + " more times.")
                 print(e)
-            except:
+            except (requests.exceptions.RequestException, ValueError, KeyError, TypeError):
                 print(
                     "getBalance failed to work for " + ticker + "! Unknown. Trying " + str(
                         self._tryAmount - 1 - i) + " more times.")
 
         return 0.0
 
+    def getCurrentPhemexPrices(self, tickers: List[str]) -> Dict[str, float]:
+        """
+        Like getCurrentPhemexPrice, but for several tickers at once.
+        :return: the price of each ticker
+        """
+        return dict(zip(tickers, _PRICE_FETCH_EXECUTOR.map(self.getCurrentPhemexPrice, tickers)))
+
+    def _sign(self, message: str) -> str:
+        if self._signer is None:
+            self._signer = hmac.new(bytes(self._phemexAPISecretKey, "utf-8"), digestmod=hashlib.sha256)
+
+        signer = self._signer.copy()
+        signer.update(bytes(message, "utf-8"))
+        return signer.hexdigest()
+
     def getIntraMinuteKline(self, tickerPair):
-        now = roundDownToMinute(datetime.utcnow())
+        utcNow = datetime.utcnow()
+        now = roundDownToMinute(utcNow)
         kline = self.phemexConnection.getOldMinuteKlineAtTimestamp(now)
 
         while kline is None:
             self.phemexConnection.logger.writeSecondary("data_stream", "PhemexDataObtainer: Kline was none during"
-                + str(now) + " " + str(datetime.utcnow()) + ", trying -1")
+                + str(now) + " " + str(utcNow) + ", trying -1")
             now -= timedelta(minutes=1)
             kline = self.phemexConnection.getOldMinuteKlineAtTimestamp(now)
 
@@ -623,10 +616,14 @@ class PhemexDataObtainer(DataObtainer):
                 or not self._obtainedDayHistoricalPhemexKlines:
             return False
 
+        # Read the clock once so that every ticker is compared against the same minute, hour and day.
+        currentMinute = datetime.utcnow().replace(second=0, microsecond=0)
+        currentHour = currentMinute.replace(minute=0)
+        currentDay = currentHour.replace(hour=0)
+
         for ticker in self._1MinDataAsDataFrames.keys():
-            if self.getLastMinute(ticker) != datetime.utcnow().replace(second=0, microsecond=0)\
-                and self.getLastHour(ticker) != datetime.utcnow().replace(minute=0, second=0, microsecond=0)\
-                and self.getLastDay(ticker) != datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0):
+            if self.getLastMinute(ticker) != currentMinute and self.getLastHour(ticker) != currentHour\
+                    and self.getLastDay(ticker) != currentDay:
                 return False
 
         return True
@@ -638,31 +635,23 @@ class PhemexDataObtainer(DataObtainer):
         curr = self.getLastMinute(ticker) if self._obtainedMinuteHistoricalPhemexKlines else\
             self.phemexConnection.getOldMinuteKlineTimestampAtIndex(0)
         newest = self.phemexConnection.getOldMinuteKlineTimestampAtIndex(-1)
-        # print("!!! (1) Starting add min at curr:", curr, "/", newest)
 
-        with self._phemexDataLock:
-            while curr <= newest:
-                # print("!!! (2) Adding min at curr:", curr, "/", newest, end="")
-                row = self.phemexConnection.getOldMinuteKlineAtTimestamp(curr)
-                # print("... (3) ...", end="")
+        while curr <= newest:
+            row = self.phemexConnection.getOldMinuteKlineAtTimestamp(curr)
+
+            # The lock is taken a row at a time, and only around our own data, so that reads don't wait for the
+            # whole backfill.
+            with self._phemexDataLock:
                 if row is not None:
                     try:
-                        # print("Adding row:", row["Open"], row["High"], row["Low"], row["Close"], row["Volume"])
                         self.addRow(ticker, curr, row["Open"], row["High"], row["Low"], row["Close"], row["Volume"], period="1m")
                     except Exception as e:
                         print("PhemexDataObtainer _addNewMinute error:", e)
                         return
-                elif curr not in self._1MinDataAsDataFrames[ticker]:
-                    # Copy the previous row.
-                    # print("1 min data frame BEFORE:", self._1MinDataAsDataFrames[ticker].head())
-                    self._1MinDataAsDataFrames[ticker].loc[curr] = self._1MinDataAsDataFrames[ticker].iloc[-1]
-                    # import traceback
-                    # print("1 min data frame AFTER:", self._1MinDataAsDataFrames[ticker].head(), self._obtainedMinuteHistoricalPhemexKlines)
-                    # print("1 min data frame index:", self._1MinDataAsDataFrames[ticker].index, self._obtainedMinuteHistoricalPhemexKlines)
-                    # traceback.print_stack()
-
-                curr += timedelta(minutes=1)
-                # print("... done")
+                else:
+                    self._copyLastRow(ticker, curr, "1m")
+
+            curr += timedelta(minutes=1)
 
         self._obtainedMinuteHistoricalPhemexKlines = True
 
@@ -673,24 +662,21 @@ class PhemexDataObtainer(DataObtainer):
         curr = self.getLastHour(ticker) if self._obtainedHourHistoricalPhemexKlines else \
             self.phemexConnection.getOldHourKlineTimestampAtIndex(0)
         newest = self.phemexConnection.getOldHourKlineTimestampAtIndex(-1)
-        # print("Starting add hour at curr:", curr, "/", newest)
 
-        with self._phemexDataLock:
-            while curr <= newest:
-                # print("Adding hour at curr:", curr, "/", newest)
-                row = self.phemexConnection.getOldHourKlineAtTimestamp(curr)
+        while curr <= newest:
+            row = self.phemexConnection.getOldHourKlineAtTimestamp(curr)
 
+            with self._phemexDataLock:
                 if row is not None:
                     try:
                         self.addRow(ticker, curr, row["Open"], row["High"], row["Low"], row["Close"], row["Volume"], period="1h")
                     except Exception as e:
                         print("PhemexDataObtainer _addNewHour error:", e)
                         return
-                elif curr not in self._1HourDataAsDataFrames[ticker]:
-                    # Copy the previous row.
-                    self._1HourDataAsDataFrames[ticker].loc[curr] = self._1HourDataAsDataFrames[ticker].iloc[-1]
+                else:
+                    self._copyLastRow(ticker, curr, "1h")
 
-                curr += timedelta(hours=1)
+            curr += timedelta(hours=1)
 
         self._obtainedHourHistoricalPhemexKlines = True
 
@@ -701,38 +687,35 @@ class PhemexDataObtainer(DataObtainer):
         curr = self.getLastDay(ticker) if self._obtainedDayHistoricalPhemexKlines else \
             self.phemexConnection.getOldDayKlineTimestampAtIndex(0)
         newest = self.phemexConnection.getOldDayKlineTimestampAtIndex(-1)
-        # print("Starting add day at curr:", curr, "/", newest)
 
-        with self._phemexDataLock:
-            while curr <= newest:
-                # print("Starting add day at curr:", curr, "/", newest)
-                row = self.phemexConnection.getOldDayKlineAtTimestamp(curr)
+        while curr <= newest:
+            row = self.phemexConnection.getOldDayKlineAtTimestamp(curr)
 
+            with self._phemexDataLock:
                 if row is not None:
                     try:
                         self.addRow(ticker, curr, row["Open"], row["High"], row["Low"], row["Close"], row["Volume"], period="1d")
                     except Exception as e:
                         print("PhemexDataObtainer _addNewDay error:", e)
                         return
-                elif curr not in self._1DayDataAsDataFrames[ticker]:
-                    # Copy the previous row.
-                    self._1DayDataAsDataFrames[ticker].loc[curr] = self._1DayDataAsDataFrames[ticker].iloc[-1]
+                else:
+                    self._copyLastRow(ticker, curr, "1d")
 
-                curr += timedelta(days=1)
+            curr += timedelta(days=1)
 
         self._obtainedDayHistoricalPhemexKlines = True
 
     def getLastMinute(self, ticker):
         with self._phemexDataLock:
-            return self._1MinDataAsDataFrames[ticker].index[-1]
+            return self._getLastTimestamp(ticker, "1m")
 
     def getLastHour(self, ticker):
         with self._phemexDataLock:
-            return self._1HourDataAsDataFrames[ticker].index[-1]
+            return self._getLastTimestamp(ticker, "1h")
 
     def getLastDay(self, ticker):
         with self._phemexDataLock:
-            return self._1DayDataAsDataFrames[ticker].index[-1]
+            return self._getLastTimestamp(ticker, "1d")
 
     def waitForMinute(self, ticker, dt, allowAnyWaitTime=False):
         if dt is None:
@@ -748,15 +731,8 @@ class PhemexDataObtainer(DataObtainer):
             else:
                 # Wait until we have updated our data to accommodate the start time.
                 # print("removeme: waiting min")
-                while True:
-                    last = self.getLastMinute(ticker)
-
-                    if dt <= last:
-                        # print("exited cuz", last, dt)
-                        # print(self._1MinDataAsDataFrames[ticker].iloc[len(self._1MinDataAsDataFrames[ticker]) - 3:len(self._1MinDataAsDataFrames[ticker])])
-                        return True
-
-                    time.sleep(1.0)
+                with self._newData:
+                    self._newData.wait_for(lambda: dt <= self._getLastTimestamp(ticker, "1m"))
 
         return True
 
@@ -773,13 +749,8 @@ class PhemexDataObtainer(DataObtainer):
                 return False
             else:
                 # Wait until we have updated our data to accommodate the start time.
-                while True:
-                    last = self.getLastHour(ticker)
-
-                    if dt <= last:
-                        return True
-
-                    time.sleep(1.0)
+                with self._newData:
+                    self._newData.wait_for(lambda: dt <= self._getLastTimestamp(ticker, "1h"))
 
         return True
 
@@ -796,17 +767,16 @@ class PhemexDataObtainer(DataObtainer):
                 return False
             else:
                 # Wait until we have updated our data to accommodate the start time.
-                while True:
-                    last = self.getLastDay(ticker)
-
-                    if dt <= last:
-                        return True
-
-                    time.sleep(1.0)
+                with self._newData:
+                    self._newData.wait_for(lambda: dt <= self._getLastTimestamp(ticker, "1d"))
 
         return True
 
     def _fixNan(self, open, high, low, close, volume):
+        # Almost every kline is complete, and a NaN anywhere makes the sum NaN, so those only cost one check.
+        if not math.isnan(open + high + low + close + volume):
+            return open, high, low, close, volume
+
         if math.isnan(volume):
             print("PhemexDataObtainer _fixNan: received a NaN volume.")
             volume = 0
@@ -6,31 +6,30 @@
 #              as clock passes. This class was taken from my PumpBot project and
 #              adapted for this project.
 
-import csv
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import pandas as pd
-import re
 import numpy as np
 
-from clock.Clock import Clock
+import clock
 from data_obtaining.DataObtainer import DataObtainer
 
+
 class PhemexHistoricalDataObtainer(DataObtainer):
     dateOfStart: datetime
     dateOfEnd: datetime
     filePathPrefix: str
     timezone: str
 
-    # Pandas makes life easy but is very slow, so we use both Pandas and a
-    # list of dicts. :clown:
+    # Each ticker's klines for a period, read straight from its CSV into a DataFrame indexed by timestamp.
     _1MinDataAsDataFrames: Dict[str, pd.DataFrame]
     _1HourDataAsDataFrames: Dict[str, pd.DataFrame]
     _1DayDataAsDataFrames: Dict[str, pd.DataFrame]
     _obtained: bool
 
     # For generating a random intra minute price
-    _lastIntraMinuteTime: datetime
+    # The ticker and minute that the last intra minute kline is for
+    _lastIntraMinuteKey: Tuple[str, datetime]
     _lastIntraMinutePrice: float
     _lastIntraMinuteHigh: float
     _lastIntraMinuteLow: float
@@ -46,7 +45,7 @@ class PhemexHistoricalDataObtainer(DataObtainer):
         self.filePathPrefix = filePathPrefix
         self.dateOfStart = dateOfStart
         self.dateOfEnd = dateOfEnd
-        self._lastIntraMinuteTime = None
+        self._lastIntraMinuteKey = None
         self._lastIntraMinutePrice = 0.0
         self._lastIntraMinuteHigh = 0.0
         self._lastIntraMinuteLow = 0.0
@@ -77,57 +76,57 @@ class PhemexHistoricalDataObtainer(DataObtainer):
 
     def obtainMinuteValues(self, ticker: str, startTime=None, endTime=None, column=None):
         df = self._1MinDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 60, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     def obtainHourValues(self, ticker: str, startTime=None, endTime=None, column=None):
         df = self._1HourDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 3600, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     def obtainDayValues(self, ticker: str, startTime=None, endTime=None, column=None):
         df = self._1DayDataAsDataFrames[ticker]
-        return self._filterByTime(df, startTime, endTime, 86400, column=column)
+        return self._filterByTime(df, startTime, endTime, column=column)
 
     # This is fast
     def obtainSingleColumnMinuteValues(self, ticker: str, column, startTime=None, endTime=None):
         df = self._1MinDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 60)
+        return self._filterSingleColumnByTime(df, column, startTime, endTime)
 
     # This is fast
     def obtainSingleColumnHourValues(self, ticker: str, column, startTime=None, endTime=None):
         df = self._1HourDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 3600)
+        return self._filterSingleColumnByTime(df, column, startTime, endTime)
 
     # This is fast
     def obtainSingleColumnDayValues(self, ticker: str, column, startTime=None, endTime=None):
         df = self._1DayDataAsDataFrames[ticker]
-        return self._filterSingleColumnByTime(df, column, startTime, endTime, 86400)
+        return self._filterSingleColumnByTime(df, column, startTime, endTime)
 
     def addCustomMinuteColumn(self, ticker, columnName, column, updateExisting=True):
         if updateExisting and columnName in self._1MinDataAsDataFrames[ticker].columns:
-            self._1MinDataAsDataFrames[ticker][columnName].update(column)
+            self._updateColumn(self._1MinDataAsDataFrames[ticker], columnName, column)
         else:
             self._1MinDataAsDataFrames[ticker][columnName] = column
 
     def addCustomHourColumn(self, ticker, columnName, column, updateExisting=True):
         if updateExisting and columnName in self._1HourDataAsDataFrames[ticker].columns:
-            self._1HourDataAsDataFrames[ticker][columnName].update(column)
+            self._updateColumn(self._1HourDataAsDataFrames[ticker], columnName, column)
         else:
             self._1HourDataAsDataFrames[ticker][columnName] = column
 
     def addCustomDayColumn(self, ticker, columnName, column, updateExisting=True):
         if updateExisting and columnName in self._1DayDataAsDataFrames[ticker].columns:
-            self._1DayDataAsDataFrames[ticker][columnName].update(column)
+            self._updateColumn(self._1DayDataAsDataFrames[ticker], columnName, column)
         else:
             self._1DayDataAsDataFrames[ticker][columnName] = column
 
     def updateMinuteEntry(self, ticker, columnName, timestamp, value):
-        self._1MinDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._1MinDataAsDataFrames[ticker].at[timestamp, columnName] = value
 
     def updateHourEntry(self, ticker, columnName, timestamp, value):
-        self._1HourDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._1HourDataAsDataFrames[ticker].at[timestamp, columnName] = value
 
     def updateDayEntry(self, ticker, columnName, timestamp, value):
-        self._1DayDataAsDataFrames[ticker][columnName].loc[timestamp] = value
+        self._1DayDataAsDataFrames[ticker].at[timestamp, columnName] = value
 
     def addEmptyMinuteColumn(self, ticker, columnName, fillValue):
         self._1MinDataAsDataFrames[ticker][columnName] = fillValue
@@ -139,21 +138,23 @@ class PhemexHistoricalDataObtainer(DataObtainer):
         self._1DayDataAsDataFrames[ticker][columnName] = fillValue
 
     def removeCustomMinuteColumn(self, ticker, columnName):
-        self._1MinDataAsDataFrames[ticker].drop(columns=[columnName])
+        del self._1MinDataAsDataFrames[ticker][columnName]
 
     def removeCustomHourColumn(self, ticker, columnName):
-        self._1HourDataAsDataFrames[ticker].drop(columns=[columnName])
+        del self._1HourDataAsDataFrames[ticker][columnName]
 
     def removeCustomDayColumn(self, ticker, columnName):
-        self._1DayDataAsDataFrames[ticker].drop(columns=[columnName])
+        del self._1DayDataAsDataFrames[ticker][columnName]
 
     def getIntraMinuteKline(self, tickerPair):
-        minute = Clock.getInstance().getMinuteTimestamp()
+        minute = clock.CLOCK.getMinuteTimestamp()
 
-        if self._lastIntraMinuteTime == minute:
+        # Callers usually ask for the same ticker several times a minute. The simulated clock's minute is what
+        # decides when the answer changes, so that is what the cache is checked against rather than the real time.
+        if self._lastIntraMinuteKey == (tickerPair, minute):
             return self._lastIntraMinutePrice, self._lastIntraMinuteHigh, self._lastIntraMinuteLow
 
-        self._lastIntraMinuteTime = minute
+        self._lastIntraMinuteKey = (tickerPair, minute)
         valuesMinutes = self._1MinIntraMinuteDataAsDataFrames[tickerPair].loc[minute]
         self._lastIntraMinutePrice = valuesMinutes["Close"]
         self._lastIntraMinuteHigh = valuesMinutes["High"]
@@ -179,75 +180,22 @@ class PhemexHistoricalDataObtainer(DataObtainer):
         self._readTickerDataHelper(tickerPair, "1d")
         self._readTickerDataHelper(tickerPair, "intraminute")
 
-    def _generateData(self, row, timing):
-        open = float(row["open"])
-        high = float(row["high"])
-        low = float(row["low"])
-        close = float(row["close"])
-        dicts = []
-        entries = []
-        trade = float(row["trades"])
-
-        d = {
-            "Timestamp": timing,
-            "Open": open,
-            "High": high,
-            "Low": low,
-            "Close": close,
-            "Volume": trade
-        }
-
-        dicts.append(d)
-        entries.append([timing, open, high, low, close, trade])
-        return entries, dicts
-
-    def _addAverage(self, ticker, period):
-        if period == "1m":
-            df = self._1MinDataAsDataFrames[ticker]
-        elif period == "1h":
-            df = self._1HourDataAsDataFrames[ticker]
-        else:
-            df = self._1DayDataAsDataFrames[ticker]
-
-        df["Average"] = (df["High"] + df["Low"] + df["Close"]) / 3
-
-    def _filterByTime(self, df: pd.DataFrame, startTime, endTime, secondsBetweenEntries: int, column=None):
-        if startTime is None:
-            start = 0
-        else:
-            start = int((startTime - df.index[0]).total_seconds() // secondsBetweenEntries)
-
-        if endTime is None:
-            end = len(df)
-        else:
-            end = int((endTime - df.index[0]).total_seconds() // secondsBetweenEntries) + 1
+    def _filterByTime(self, df: pd.DataFrame, startTime, endTime, column=None):
+        start, end = self._findBounds(df.index, startTime, endTime)
 
         if column is not None:
             return df[column].iloc[start:end]
 
         return df.iloc[start:end]
 
-    def _filterSingleColumnByTime(self, df: pd.DataFrame, column: str, startTime, endTime, secondsBetweenEntries: int):
-        if startTime is None:
-            start = 0
-        else:
-            start = int((startTime - df.index[0]).total_seconds() // secondsBetweenEntries)
-
-        if endTime is None:
-            end = len(df)
-        else:
-            end = int((endTime - df.index[0]).total_seconds() // secondsBetweenEntries) + 1
+    def _filterSingleColumnByTime(self, df: pd.DataFrame, column: str, startTime, endTime):
+        start, end = self._findBounds(df.index, startTime, endTime)
+        x = df[column].values[start:end]
 
-        return df[column].values[start:end]
+        return x
 
     def _readTickerDataHelper(self, ticker, period):
-        listOfDicts = []
-        entries = []
-
         path = self.filePathPrefix + ticker + "-" + period + "-data.csv"
-        count = 0
-        numSamples = 0
-        previousTiming = None
 
         if period == "1m" or period == "intraminute":
             interval = timedelta(minutes=1)
@@ -257,78 +205,21 @@ class PhemexHistoricalDataObtainer(DataObtainer):
             # 1 day
             interval = timedelta(days=1)
 
-        try:
-            with open(path, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                for row in reader:
-                    timestamp = row["timestamp"]
-                    times = re.split(r'[-/:\s]\s*', timestamp)
-
-                    if len(times) < 5:
-                        continue
-
-                    try:
-                        if "/" in timestamp:
-                            timing = datetime(int(times[0]), int(times[1]),
-                                              int(times[2]), int(times[3]),
-                                              int(times[4]))
-                        else:
-                            timing = datetime(int(times[2]), int(times[1]),
-                                              int(times[0]), int(times[3]),
-                                              int(times[4]))
-                    except:
-                        print("Error reading historical timestamp " + str(
-                            timestamp) + " for " + ticker + ".")
-                        continue
-
-                    if timing < self.dateOfStart:
-                        continue
-
-                    if timing > self.dateOfEnd:
-                        break
-
-                    if previousTiming == timing:
-                        # Sometimes, Binance data has duplicate entries for some reason.
-                        continue
-
-                    if previousTiming is not None and previousTiming + interval < timing:
-                        previousTiming += interval
-                        while previousTiming != timing:
-                            entries2, dicts = self._generateData(row, previousTiming)
-                            listOfDicts += dicts
-                            numSamples += 1
-                            entries += entries2
-                            count += 1
-                            previousTiming += interval
-
-                    previousTiming = timing
-                    entries2, dicts = self._generateData(row, timing)
-                    listOfDicts += dicts
-                    numSamples += 1
-                    entries += entries2
-                    count += 1
-
-                    if count == 10000:
-                        print("Read " + ticker + " data up to " + str(timing))
-                        count = 0
-
-            df = pd.DataFrame(entries, index=[i for i in range(numSamples)],
-                columns=["Timestamp", "Open", "High", "Low", "Close", "Volume"])
-            df = df.set_index("Timestamp")
-
-            if period == "1m":
-                self._1MinDataAsDataFrames[ticker] = df
-            elif period == "1h":
-                self._1HourDataAsDataFrames[ticker] = df
-            elif period == "intraminute":
-                self._1MinIntraMinuteDataAsDataFrames[ticker] = df
-            else:
-                # 1 day
-                self._1DayDataAsDataFrames[ticker] = df
-
-            self._addAverage(ticker, period)
-            print("Done reading " + ticker + " historical data.")
-
-        except IOError as e:
-            print("Could not read " + path + "!")
+        df = self._readKlineCsv(path, ticker, interval, dateOfStart=self.dateOfStart, dateOfEnd=self.dateOfEnd)
+
+        if df is None:
+            return
+
+        df["Average"] = (df["High"].to_numpy() + df["Low"].to_numpy() + df["Close"].to_numpy()) / 3
+
+        if period == "1m":
+            self._1MinDataAsDataFrames[ticker] = df
+        elif period == "1h":
+            self._1HourDataAsDataFrames[ticker] = df
+        elif period == "intraminute":
+            self._1MinIntraMinuteDataAsDataFrames[ticker] = df
+        else:
+            # 1 day
+            self._1DayDataAsDataFrames[ticker] = df
+
+        print("Done reading " + ticker + " historical data.")
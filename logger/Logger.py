@@ -1,13 +1,23 @@
+import atexit
+import queue
 import sys
+import threading as th
 import time
 
+# Log files are buffered this much, since they are only flushed every saveInterval seconds anyway.
+_BUFFER_SIZE = 1 << 16
+# Queued in place of a message to tell the writing thread to stop.
+_STOP = object()
+# How long, in seconds, the program waits at exit for queued messages to be written before giving up on them.
+_FINISH_TIMEOUT = 5.0
+
 
 class Logger:
     def __init__(self, filename: str, secondaryFiles={}, saveInterval=60):
         self.terminal = sys.stdout
         self.filename = filename
         self.saveInterval = saveInterval
-        self.log = open(filename, "w")
+        self.log = open(filename, "w", buffering=_BUFFER_SIZE)
         self.log.write("")
 
         self.secondaryLogs = {}
@@ -15,12 +25,86 @@ class Logger:
         self.secondaryFiles = secondaryFiles
 
         for tag, path in secondaryFiles.items():
-            self.secondaryLogs[tag] = open(path, "w")
+            self.secondaryLogs[tag] = open(path, "w", buffering=_BUFFER_SIZE)
             self.secondaryLogs[tag].write("")
 
         self._saveAll()
 
+        # Messages are written out by a separate thread so that callers, which include every print, don't wait on the
+        # terminal or the files.
+        self._queue = queue.Queue()
+        self._writer = th.Thread(target=self._writeLoop, daemon=True)
+        self._writer.start()
+        atexit.register(self._finish)
+
     def write(self, message: str):
+        self._queue.put((None, message, ()))
+
+    def writeSecondary(self, tag: str, message: str, *args):
+        """
+        Writes a line to a secondary file.
+        :param tag: the secondary file, as passed in secondaryFiles
+        :param message: the line, which is %-formatted with args if any are given
+        :param args: formatted into message by the writing thread rather than by the caller, so they shouldn't be
+                     changed afterwards
+        """
+        if tag not in self.secondaryFiles:
+            raise KeyError(tag)
+
+        self._queue.put((tag, message, args))
+
+    def isEnabledFor(self, tag: str) -> bool:
+        """
+        :return: if there is a secondary file for tag, so that callers can skip building messages that can't be written
+        """
+        return tag in self.secondaryFiles
+
+    def _finish(self):
+        """
+        Writes out whatever is still queued when the program exits. If the writing thread is stuck, exiting only
+        waits for it up to _FINISH_TIMEOUT.
+        """
+        self._queue.put(_STOP)
+        self._writer.join(_FINISH_TIMEOUT)
+
+        try:
+            self._saveAll()
+        except (OSError, ValueError) as e:
+            self.terminal.write("Logger: could not save: " + str(e) + "\n")
+
+    def _writeLoop(self):
+        while True:
+            item = self._queue.get()
+
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            tag, message, args = item
+
+            try:
+                if args:
+                    message = message % args
+
+                if tag is None:
+                    self._write(message)
+                else:
+                    self._writeSecondary(tag, message)
+
+                # Saving waits until everything queued so far is written, so a burst of messages is saved once rather
+                # than after each of them, even with a saveInterval of 0.
+                if self._queue.empty() and self.lastSaveTime + self.saveInterval < time.time():
+                    self._saveAll()
+            except Exception as e:
+                # Nothing may stop this thread, or every later message would queue up without being written.
+                try:
+                    self.terminal.write("Logger: could not write " + str(message) + ": " + str(e) + "\n")
+                except Exception:
+                    pass
+            finally:
+                self._queue.task_done()
+
+    def _write(self, message: str):
         self.terminal.write(message)
 
         written = self.log.write(message)
@@ -28,7 +112,7 @@ class Logger:
         if written != len(message):
             # Try to close the file and try again.
             if self.log.closed:
-                self.log = open(self.filename, "a")
+                self.log = open(self.filename, "a", buffering=_BUFFER_SIZE)
                 self.lastSaveTime = time.time()
 
             written += self.log.write(message[written:])
@@ -39,13 +123,10 @@ class Logger:
                 # raise Exception("Logger: could not write " + message + " to "\
                 #     "write(), only wrote " + str(written) + " elements.")
 
-        if self.lastSaveTime + self.saveInterval < time.time():
-            self._saveAll()
-
-    def writeSecondary(self, tag: str, message: str):
+    def _writeSecondary(self, tag: str, message: str):
         # Just in case, because sometimes files close by themselves??
         if self.secondaryLogs[tag].closed:
-            self.secondaryLogs[tag] = open(self.secondaryFiles[tag], "a")
+            self.secondaryLogs[tag] = open(self.secondaryFiles[tag], "a", buffering=_BUFFER_SIZE)
 
         message = message + "\n"
         written = self.secondaryLogs[tag].write(message)
@@ -53,7 +134,7 @@ class Logger:
         if written != len(message):
             # Try to close the file and try again.
             if self.secondaryLogs[tag].closed:
-                self.secondaryLogs[tag] = open(self.secondaryFiles[tag], "a")
+                self.secondaryLogs[tag] = open(self.secondaryFiles[tag], "a", buffering=_BUFFER_SIZE)
 
             written += self.secondaryLogs[tag].write(message[written:])
 
@@ -64,9 +145,6 @@ class Logger:
                 print("Logger: could not write " + message + " to "
                       + tag + ", only wrote " + str(written) + " elements.")
 
-        if self.lastSaveTime + self.saveInterval < time.time():
-            self._saveAll()
-
     def flush(self):
         pass
 
@@ -74,18 +152,21 @@ class Logger:
         return False
 
     def _saveAll(self):
-        if not self.log.closed:
-            self.log.close()
+        # Flushing gets what has been written into the file without the cost of closing and reopening it.
+        if self.log.closed:
+            self.log = open(self.filename, "a", buffering=_BUFFER_SIZE)
+        else:
+            self.log.flush()
 
-        self.log = open(self.filename, "a")
         self.lastSaveTime = time.time()
 
         for tag in self.secondaryLogs:
             self._saveSecondary(tag)
 
     def _saveSecondary(self, tag: str):
-        if not self.secondaryLogs[tag].closed:
-            self.secondaryLogs[tag].close()
+        if self.secondaryLogs[tag].closed:
+            self.secondaryLogs[tag] = open(self.secondaryFiles[tag], "a", buffering=_BUFFER_SIZE)
+        else:
+            self.secondaryLogs[tag].flush()
 
-        self.secondaryLogs[tag] = open(self.secondaryFiles[tag], "a")
         self.lastSecondarySaveTimes[tag] = time.time()
@@ -1,8 +1,8 @@
-from collections import OrderedDict
+import threading as th
 from time import sleep
 
 import requests
-from binance import Client
+from binance import Client, ThreadedDepthCacheManager
 
 from orderbook.Orderbook import Orderbook
 
@@ -11,23 +11,36 @@ class BinanceOrderbook(Orderbook):
     def __init__(self, ticker: str, depth=1):
         super().__init__()
         self.ticker = ticker
-        self.client = Client(api_key="", api_secret="")
+        # The client keeps one requests session for every update. A stalled request is given up on and retried rather
+        # than holding up the trader indefinitely.
+        self.client = Client(api_key="", api_secret="", requests_params={"timeout": 10})
         self.depth = depth
 
     def update(self):
         while True:
             try:
                 orderbook = self.client.get_order_book(symbol=self.ticker, limit=self.depth)
-                self.orderbook["bids"] = OrderedDict()
-                self.orderbook["asks"] = OrderedDict()
-                
-                for i in range(len(orderbook["bids"])):
-                    self.orderbook["bids"][float(orderbook["bids"][i][0])] = float(orderbook["bids"][i][1])
-                    
-                for i in range(len(orderbook["asks"])):
-                    self.orderbook["asks"][float(orderbook["asks"][i][0])] = float(orderbook["asks"][i][1])
-                    
+                self._setSnapshot(((float(price), float(quantity)) for price, quantity in orderbook["bids"]),
+                                  ((float(price), float(quantity)) for price, quantity in orderbook["asks"]))
                 break
             except requests.exceptions.ReadTimeout:
                 print("BinanceOrderbook update() Connection error...")
                 sleep(1.0)
+
+    def startFeed(self, changed: th.Condition, interval=None):
+        """
+        Keeps the book up to date from Binance's depth stream rather than by polling. python-binance keeps a local
+        copy of the book from one snapshot plus the stream's diffs, and hands it to us whenever it changes.
+        :param changed: the condition to notify, usually shared by all of the orderbooks being traded on
+        :param interval: unused, since Binance pushes changes to us
+        """
+        self.changed = changed
+        manager = ThreadedDepthCacheManager()
+        # Like the polling threads, this shouldn't keep the program alive by itself.
+        manager.daemon = True
+        manager.start()
+        manager.start_depth_cache(callback=self._onDepthCache, symbol=self.ticker)
+
+    def _onDepthCache(self, depthCache):
+        # The depth cache already holds float [price, quantity] pairs, sorted best first.
+        self._setSnapshot(depthCache.get_bids()[:self.depth], depthCache.get_asks()[:self.depth])
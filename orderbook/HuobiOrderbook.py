@@ -1,4 +1,3 @@
-from collections import OrderedDict
 from time import sleep
 
 import requests
@@ -19,14 +18,8 @@ class HuobiOrderbook(Orderbook):
         while True:
             try:
                 orderbook = self.client.get_pricedepth(self.ticker, DepthStep.STEP0, self.depth)
-                self.orderbook["bids"] = OrderedDict()
-                self.orderbook["asks"] = OrderedDict()
-
-                for i in range(len(orderbook.bids)):
-                    self.orderbook["bids"][orderbook.bids[i].price] = orderbook.bids[i].amount
-
-                for i in range(len(orderbook.asks)):
-                    self.orderbook["asks"][orderbook.asks[i].price] = orderbook.asks[i].amount
+                self._setSnapshot(((bid.price, bid.amount) for bid in orderbook.bids),
+                                  ((ask.price, ask.amount) for ask in orderbook.asks))
                 break
             except Exception as e:
                 print("HuobiOrderbook update() Connection error...")
@@ -1,17 +1,24 @@
 import json
-from collections import OrderedDict
 from time import sleep
 
 import requests
 
 from orderbook.Orderbook import Orderbook
 
+try:
+    from orjson import loads as _loadJson
+except ImportError:
+    # The standard library parses the same JSON, only more slowly.
+    _loadJson = json.loads
+
 
 class KuCoinOrderbook(Orderbook):
     def __init__(self, ticker: str, depth=1):
         super().__init__()
         self.ticker = ticker
         self.depth = depth
+        # Reuses the connection to KuCoin between updates instead of opening a new one every time.
+        self.session = requests.Session()
 
         # KuCoin only allows us to request with a depth of 20 or 100.
         if depth > 100 or depth < 0:
@@ -23,17 +30,24 @@ class KuCoinOrderbook(Orderbook):
         while True:
             try:
                 uri = "/api/v1/market/orderbook/level2_" + self.requestedDepth + "?symbol=" + self.ticker
-                response = requests.get("https://api.kucoin.com" + uri)
-                orderbook = response.content.decode("utf-8")
-                orderbook = json.loads(orderbook)
-                orderbook = orderbook["data"]
-
-                for i in range(min(len(orderbook["bids"]), self.depth)):
-                    self.orderbook["bids"][float(orderbook["bids"][i][0])] = float(orderbook["bids"][i][1])
-
-                for i in range(min(len(orderbook["asks"]), self.depth)):
-                    self.orderbook["asks"][float(orderbook["asks"][i][0])] = float(orderbook["asks"][i][1])
-
+                # A stalled connection is given up on and retried rather than holding up the trader indefinitely.
+                response = self.session.get("https://api.kucoin.com" + uri, timeout=10)
+
+                if response.status_code == 429:
+                    # KuCoin limits how often each IP can ask. Retrying every second would only keep us over the limit,
+                    # so give it time to reset.
+                    print("KuCoinOrderbook update() Rate limited...")
+                    sleep(10.0)
+                    continue
+
+                # Parsed straight from the bytes, without decoding them into a string first.
+                orderbook = _loadJson(response.content)["data"]
+                # This is a full snapshot, so it replaces the book rather than being merged into it, which would
+                # leave stale levels in front of the current best prices.
+                bids = orderbook["bids"][:self.depth]
+                asks = orderbook["asks"][:self.depth]
+                self._setSnapshot(((float(price), float(quantity)) for price, quantity in bids),
+                                  ((float(price), float(quantity)) for price, quantity in asks))
                 break
             except Exception as e:
                 print("KuCoinOrderbook update() Connection error...")
@@ -1,4 +1,6 @@
+import threading as th
 from collections import OrderedDict
+from time import sleep
 
 from typing import Tuple
 
@@ -6,10 +8,52 @@ from typing import Tuple
 class Orderbook:
     def __init__(self):
         self.orderbook = {"bids": OrderedDict(), "asks": OrderedDict()}
+        # Incremented whenever the book changes, so that callers can tell if quotes they read earlier are stale.
+        self.version = 0
+        # Held while the book is changed, and notified afterwards. startFeed swaps in one shared with the reader.
+        self.changed = th.Condition()
 
     def update(self):
         pass
 
+    def startFeed(self, changed: th.Condition, interval: float):
+        """
+        Keeps the book up to date in a background thread. The book is only changed while holding changed's lock, and
+        changed is notified after each change, so a reader can wait on it instead of polling.
+        By default this calls update() every interval seconds. Exchanges that push their book override this.
+        :param changed: the condition to notify, usually shared by all of the orderbooks being traded on
+        :param interval: seconds between updates, which should keep within the exchange's rate limit
+        """
+        self.changed = changed
+        th.Thread(target=self._pollLoop, args=(interval,), daemon=True).start()
+
+    def _pollLoop(self, interval: float):
+        while True:
+            try:
+                self.update()
+            except Exception as e:
+                # Keep on polling. If this thread ended, the book would silently stay as it is and be traded on stale.
+                print(type(self).__name__ + " update() failed: " + str(e))
+
+            sleep(interval)
+
+    def _setSnapshot(self, bids, asks):
+        """
+        Replaces the whole book with a snapshot from the exchange. Each side is refilled in place rather than
+        reallocated, since this runs on every refresh.
+        :param bids: (price, quantity) pairs, highest price first
+        :param asks: (price, quantity) pairs, lowest price first
+        """
+        with self.changed:
+            side = self.orderbook["bids"]
+            side.clear()
+            side.update(bids)
+            side = self.orderbook["asks"]
+            side.clear()
+            side.update(asks)
+            self.version += 1
+            self.changed.notify_all()
+
     def getHighestBid(self):
         if len(self.orderbook["bids"]) == 0:
             return None, None
@@ -24,6 +68,14 @@ class Orderbook:
         first = next(iter(self.orderbook["asks"]))
         return first, self.orderbook["asks"][first]
 
+    def getTopOfBook(self) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+        """
+        Returns the lowest ask and the highest bid together, each as (price, quantity) or (None, None) if that side is
+        empty. Callers that want both sides should prefer this over two separate calls.
+        """
+        return next(iter(self.orderbook["asks"].items()), (None, None)), \
+            next(iter(self.orderbook["bids"].items()), (None, None))
+
     def reduceBidQuantity(self, price, quantity) -> float:
         """
         Reduces a bid by a certain quantity
@@ -38,7 +90,8 @@ class Orderbook:
             self.orderbook["bids"].pop(price)
         else:
             self.orderbook["bids"][price] = newQuantity
-            
+
+        self.version += 1
         return old - newQuantity
 
     def reduceAskQuantity(self, price, quantity):
@@ -55,7 +108,8 @@ class Orderbook:
             self.orderbook["asks"].pop(price)
         else:
             self.orderbook["asks"][price] = newQuantity
-            
+
+        self.version += 1
         return old - newQuantity
 
     def liquidate(self, quantity: float) -> Tuple[float, float]:
@@ -66,17 +120,32 @@ class Orderbook:
         """
         amountSold = 0.0
         baseCurrencyReceived = 0.0
+        bids = self.orderbook["bids"]
+        changed = False
+
+        # This does what reduceBidQuantity does to each level it sells into, but works on the bids directly and only
+        # changes the version once.
+        while amountSold < quantity and len(bids) > 0:
+            price, old = next(iter(bids.items()))
+            newQuantity = max(old - (quantity - amountSold), 0.0)
 
-        while amountSold < quantity and len(self.orderbook["bids"]) > 0:
-            price = next(iter(self.orderbook["bids"]))
-            amount = self.reduceBidQuantity(price, quantity - amountSold)
+            if newQuantity <= 0.0:
+                bids.popitem(last=False)
+            else:
+                bids[price] = newQuantity
+
+            changed = True
+            amount = old - newQuantity
 
             if amount == 0.0:
-                return amountSold, baseCurrencyReceived
+                break
 
             amountSold += amount
             baseCurrencyReceived += amount * price
 
+        if changed:
+            self.version += 1
+
         return amountSold, baseCurrencyReceived
 
 
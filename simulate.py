@@ -1,7 +1,7 @@
 import os
+import threading as th
 import time
 from datetime import datetime
-from time import sleep
 
 from algo.Trader import Trader
 from logger.Logger import Logger
@@ -45,46 +45,52 @@ def main():
     # What decides our trades:
     trader = Trader("XNO", "USDT")
 
+    # The orderbooks keep themselves up to date in the background and only change while this is held. The loop below
+    # holds it except while waiting for the next change, so it never sees a book half way through an update.
+    changed = th.Condition()
+    # Binance pushes changes to its book, so it isn't polled.
+    binanceOrderbook.startFeed(changed)
+    # KuCoin's book is polled over REST. KuCoin limits public requests per IP, and anything else on this machine
+    # shares that budget, so one snapshot every few seconds keeps well clear of it while still being far fresher than
+    # the 20 seconds this used to poll at.
+    kuCoinPollInterval = 3.0 # seconds
+    kuCoinOrderbook.startFeed(changed, kuCoinPollInterval)
+
     currentTrades = []
-    lastOrderbookUpdateTime = 0
-    orderbookUpdateInterval = 20000000000 # 20 seconds in nanoseconds
     lastOrderbookOutputTime = 0
     orderbookOutputInterval = 60000000000 # 60 seconds in nanoseconds
     lastWalletOutputTime = 0
     walletOutputInterval = 60000000000 # 60 seconds in nanoseconds
 
-    while True:
-        now = time.time_ns()
-
-        if now >= lastOrderbookUpdateTime + orderbookUpdateInterval:
-            binanceOrderbook.update()
-            # huobiOrderbook.update()
-            kuCoinOrderbook.update()
-            lastOrderbookUpdateTime = now
-
-        if now >= lastOrderbookOutputTime + orderbookOutputInterval:
-            # print(datetime.utcnow(), "orderbooks, Binance:", str(binanceOrderbook), "Huobi:", str(huobiOrderbook))
-            print(datetime.utcnow(), "orderbooks, Binance:", str(binanceOrderbook), "KuCoin:", str(kuCoinOrderbook))
-            lastOrderbookOutputTime = now
+    with changed:
+        while True:
+            # Any number of orderbook changes while we were stepping only wake us up once, for the latest books. Without
+            # any, we still wake up when output is due or when a transfer is done, since that trade needs stepping.
+            wakeTime = min(lastOrderbookOutputTime + orderbookOutputInterval,
+                           lastWalletOutputTime + walletOutputInterval)
 
-        currentTrades += trader.step(orderbooks, wallets, logger)
-        toPop = []
+            for trade in currentTrades:
+                transferEndTime = trade.getTransferEndTime()
 
-        for i in range(len(currentTrades)):
-            done = currentTrades[i].step(orderbooks, wallets, logger)
+                if transferEndTime is not None and transferEndTime < wakeTime:
+                    wakeTime = transferEndTime
 
-            if done:
-                toPop.append(i)
+            changed.wait(max(wakeTime - time.time_ns(), 0.0) / 1000000000.0)
+            now = time.time_ns()
 
-        for i in range(len(toPop)):
-            currentTrades.pop(toPop[i] - i)
+            if now >= lastOrderbookOutputTime + orderbookOutputInterval:
+                # print(datetime.utcnow(), "orderbooks, Binance:", str(binanceOrderbook), "Huobi:", str(huobiOrderbook))
+                print(datetime.utcnow(), "orderbooks, Binance:", str(binanceOrderbook), "KuCoin:", str(kuCoinOrderbook))
+                lastOrderbookOutputTime = now
 
-        if now >= lastWalletOutputTime + walletOutputInterval:
-            # print(datetime.utcnow(), "wallets, Binance:", wallets[0], "Huobi:", wallets[1])
-            print(datetime.utcnow(), "wallets, Binance:", wallets[0], "KuCoin:", wallets[1])
-            lastWalletOutputTime = now
+            currentTrades += trader.step(orderbooks, wallets, logger)
+            # Steps every trade, keeping the ones that aren't done yet.
+            currentTrades = [trade for trade in currentTrades if not trade.step(orderbooks, wallets, logger)]
 
-        sleep(0.05)
+            if now >= lastWalletOutputTime + walletOutputInterval:
+                # print(datetime.utcnow(), "wallets, Binance:", wallets[0], "Huobi:", wallets[1])
+                print(datetime.utcnow(), "wallets, Binance:", wallets[0], "KuCoin:", wallets[1])
+                lastWalletOutputTime = now
 
 if __name__ == "__main__":
     main()
@@ -7,6 +7,10 @@ from wallet.Wallet import Wallet
 
 
 class CrossTrade:
+    __slots__ = ("exchangeBoughtFrom", "exchangeSoldTo", "currency", "baseCurrency", "currentStep", "amountSold",
+                 "amountToTransferBack", "amountInTradedCurrency", "transferStartTime", "tradedCurrencyTransferTime",
+                 "baseCurrencyTransferTime", "sellTradeFee", "sellWithdrawalFee")
+
     def __init__(self, exchangeBoughtFrom: int, exchangeSoldTo: int, currency: str, baseCurrency: str):
         self.exchangeBoughtFrom = exchangeBoughtFrom # 0 or 1
         self.exchangeSoldTo = exchangeSoldTo # 0 or 1
@@ -30,86 +34,142 @@ class CrossTrade:
         :param wallets:
         :return: if the trade finished
         """
-        # The step where we buy the currency on the exchange to buy from
-        if self.currentStep == 0:
-            balance1 = wallets[self.exchangeBoughtFrom].getBalance(self.baseCurrency)
-
-            if balance1 <= 0.0:
-                # End the trade since it cannot occur.
-                logger.writeSecondary("detailed_output", str(self) + " could not step at currentStep 0 0: " + str(balance1))
-                return True
-
-            purchasablePrice, purchasableAmount = orderbooks[self.exchangeBoughtFrom].getLowestAsk()
-            sellablePrice, sellableAmount = orderbooks[self.exchangeSoldTo].getHighestBid()
-            logger.writeSecondary("detailed_output", str(self) + " prices: " + str(purchasablePrice) + ", " +
-                                  str(purchasableAmount) + ", " + str(sellablePrice) + ", " + str(sellableAmount))
-
-            # See how much of the traded currency we can buy based on the orderbooks of the two currencies
-            self.amountInTradedCurrency = min(purchasableAmount, sellableAmount)
-
-            # See if our wallet from the exchange we purchase from limits how much we can buy
-            amountPurchasable = balance1 / purchasablePrice
-            self.amountInTradedCurrency = min(self.amountInTradedCurrency, amountPurchasable)
-            logger.writeSecondary("detailed_output", str(self) + " amountInTradedCurrency: " +
-                                  str(self.amountInTradedCurrency) + ", " + str(amountPurchasable) + ", " +
-                                  str(balance1) + ", " + str(purchasablePrice))
-
-            if self.amountInTradedCurrency <= 0.0:
-                # End the trade since it cannot occur.
-                logger.writeSecondary("detailed_output", str(self) + " could not step at currentStep 0 1: " + str(self.amountInTradedCurrency))
-                return True
-
-            orderbooks[self.exchangeBoughtFrom].reduceAskQuantity(purchasablePrice, self.amountInTradedCurrency)
-            self.amountInTradedCurrency *= (1.0 - wallets[self.exchangeBoughtFrom].getTradeFee())
-            amountInBaseCurrency = self.amountInTradedCurrency * purchasablePrice
-            wallets[self.exchangeBoughtFrom].withdraw(amountInBaseCurrency, self.baseCurrency)
-            logger.writeSecondary("detailed_output", str(self) + " amountInBaseCurrency: " + str(amountInBaseCurrency) +
-                                  ", " + str(self.amountInTradedCurrency))
-
-            # We will now be transferring the currency to the other exchange, also known as "step 1"
-            self.transferStartTime = time.time_ns()
-            self.currentStep = 1
-        elif self.currentStep == 1:
-            # The traded currency is being transferred from the exchange it was bought from to the exchange it will be
-            # sold to.
-            if time.time_ns() < self.transferStartTime + self.tradedCurrencyTransferTime:
-                # Still transferring...
-                return False
-
-            logger.writeSecondary("detailed_output", str(self) + " current step went from 1 to 2")
-            self.currentStep = 2
-        elif self.currentStep == 2:
-            # We are ready to fulfill buy orders on the exchange we will sell to.
-            # The orderbook of this exchange may have changed. We want to sell ALL of our traded currency.
-            amount, baseCurrencyReceived = orderbooks[self.exchangeSoldTo].liquidate(self.amountInTradedCurrency)
-            self.amountSold += amount
-            transferBackAmount = baseCurrencyReceived * (1.0 - wallets[self.exchangeSoldTo].getTradeFee())\
-                                         - wallets[self.exchangeSoldTo].getWithdrawalFee(self.baseCurrency)
-            self.amountToTransferBack += transferBackAmount
-
-            if self.amountSold < self.amountInTradedCurrency:
-                logger.writeSecondary("detailed_output", str(self) + " could not step at currentStep 2 0: " + str(
-                    self.amountInTradedCurrency) + ", " + str(self.amountSold))
-                return False
-
-            logger.writeSecondary("detailed_output", str(self) + " amount: " + str(amount) +
-                                  ", " + str(baseCurrencyReceived) + ", " + str(self.amountSold) + ", " +
-                                  str( self.amountToTransferBack) + ", " +
-                                  str(wallets[self.exchangeSoldTo].getTradeFee()) + ", " +
-                                  str(wallets[self.exchangeSoldTo].getWithdrawalFee(self.baseCurrency)) + ", " +
-                                  str(transferBackAmount) + ", " + str(self.amountInTradedCurrency))
-            self.currentStep = 3
-            self.transferStartTime = time.time_ns()
-        elif self.currentStep == 3:
-            # Transfer money back to the exchange it came from
-            if time.time_ns() < self.transferStartTime + self.tradedCurrencyTransferTime:
-                # Still transferring...
-                return False
-
-            wallets[self.exchangeBoughtFrom].deposit(self.amountToTransferBack, self.baseCurrency)
-            logger.writeSecondary("detailed_output", str(self) + " current step went from 3 to done! " +
-                                  str(self.amountToTransferBack) + ", " + self.baseCurrency)
+        # Messages are only built if they will be written.
+        detailed = logger.isEnabledFor("detailed_output")
+
+        return CrossTrade._STEPS[self.currentStep](self, orderbooks, wallets, logger, detailed)
+
+    def _buy(self, orderbooks: List[Orderbook], wallets: List[Wallet], logger: Logger, detailed: bool) -> bool:
+        """
+        Step 0: buys the traded currency on the exchange to buy from.
+        """
+        wallet = wallets[self.exchangeBoughtFrom]
+        balance1 = wallet.getBalance(self.baseCurrency)
+
+        if balance1 <= 0.0:
+            # End the trade since it cannot occur.
+            if detailed:
+                logger.writeSecondary("detailed_output", "%s could not step at currentStep 0 0: %s", self, balance1)
+
+            return True
+
+        purchasablePrice, purchasableAmount = orderbooks[self.exchangeBoughtFrom].getLowestAsk()
+        sellablePrice, sellableAmount = orderbooks[self.exchangeSoldTo].getHighestBid()
+
+        if detailed:
+            logger.writeSecondary("detailed_output", "%s prices: %s, %s, %s, %s", self, purchasablePrice,
+                                  purchasableAmount, sellablePrice, sellableAmount)
+
+        # See how much of the traded currency we can buy based on the orderbooks of the two currencies
+        amountInTradedCurrency = purchasableAmount if purchasableAmount < sellableAmount else sellableAmount
+
+        # See if our wallet from the exchange we purchase from limits how much we can buy
+        amountPurchasable = balance1 / purchasablePrice
+
+        if amountPurchasable < amountInTradedCurrency:
+            amountInTradedCurrency = amountPurchasable
+
+        self.amountInTradedCurrency = amountInTradedCurrency
+
+        if detailed:
+            logger.writeSecondary("detailed_output", "%s amountInTradedCurrency: %s, %s, %s, %s", self,
+                                  self.amountInTradedCurrency, amountPurchasable, balance1, purchasablePrice)
+
+        if self.amountInTradedCurrency <= 0.0:
+            # End the trade since it cannot occur.
+            if detailed:
+                logger.writeSecondary("detailed_output", "%s could not step at currentStep 0 1: %s", self,
+                                      self.amountInTradedCurrency)
+
             return True
 
+        orderbooks[self.exchangeBoughtFrom].reduceAskQuantity(purchasablePrice, self.amountInTradedCurrency)
+        self.amountInTradedCurrency *= (1.0 - wallet.getTradeFee())
+        amountInBaseCurrency = self.amountInTradedCurrency * purchasablePrice
+        wallet.withdraw(amountInBaseCurrency, self.baseCurrency)
+
+        if detailed:
+            logger.writeSecondary("detailed_output", "%s amountInBaseCurrency: %s, %s", self, amountInBaseCurrency,
+                                  self.amountInTradedCurrency)
+
+        # Step 2 can take many tries to sell everything, and the fees at the exchange we sell to don't change, so
+        # they are only looked up once.
+        self.sellTradeFee = wallets[self.exchangeSoldTo].getTradeFee()
+        self.sellWithdrawalFee = wallets[self.exchangeSoldTo].getWithdrawalFee(self.baseCurrency)
+
+        # We will now be transferring the currency to the other exchange, also known as "step 1"
+        self.transferStartTime = time.time_ns()
+        self.currentStep = 1
         return False
 
+    def _transfer(self, orderbooks: List[Orderbook], wallets: List[Wallet], logger: Logger, detailed: bool) -> bool:
+        """
+        Step 1: the traded currency is being transferred from the exchange it was bought from to the exchange it will
+        be sold to.
+        """
+        if time.time_ns() < self.transferStartTime + self.tradedCurrencyTransferTime:
+            # Still transferring...
+            return False
+
+        if detailed:
+            logger.writeSecondary("detailed_output", "%s current step went from 1 to 2", self)
+
+        self.currentStep = 2
+        return False
+
+    def _sell(self, orderbooks: List[Orderbook], wallets: List[Wallet], logger: Logger, detailed: bool) -> bool:
+        """
+        Step 2: sells the traded currency on the exchange to sell to.
+        """
+        # We are ready to fulfill buy orders on the exchange we will sell to.
+        # The orderbook of this exchange may have changed. We want to sell ALL of our traded currency.
+        amount, baseCurrencyReceived = orderbooks[self.exchangeSoldTo].liquidate(self.amountInTradedCurrency)
+        self.amountSold += amount
+        transferBackAmount = baseCurrencyReceived * (1.0 - self.sellTradeFee) - self.sellWithdrawalFee
+        self.amountToTransferBack += transferBackAmount
+
+        if self.amountSold < self.amountInTradedCurrency:
+            if detailed:
+                logger.writeSecondary("detailed_output", "%s could not step at currentStep 2 0: %s, %s", self,
+                                      self.amountInTradedCurrency, self.amountSold)
+
+            return False
+
+        if detailed:
+            logger.writeSecondary("detailed_output", "%s amount: %s, %s, %s, %s, %s, %s, %s, %s", self, amount,
+                                  baseCurrencyReceived, self.amountSold, self.amountToTransferBack,
+                                  self.sellTradeFee, self.sellWithdrawalFee, transferBackAmount,
+                                  self.amountInTradedCurrency)
+
+        self.currentStep = 3
+        self.transferStartTime = time.time_ns()
+        return False
+
+    def _transferBack(self, orderbooks: List[Orderbook], wallets: List[Wallet], logger: Logger,
+                      detailed: bool) -> bool:
+        """
+        Step 3: the base currency is being transferred back to the exchange it came from.
+        """
+        if time.time_ns() < self.transferStartTime + self.tradedCurrencyTransferTime:
+            # Still transferring...
+            return False
+
+        wallets[self.exchangeBoughtFrom].deposit(self.amountToTransferBack, self.baseCurrency)
+
+        if detailed:
+            logger.writeSecondary("detailed_output", "%s current step went from 3 to done! %s, %s", self,
+                                  self.amountToTransferBack, self.baseCurrency)
+
+        return True
+
+    # What step() does at each value of currentStep
+    _STEPS = (_buy, _transfer, _sell, _transferBack)
+
+    def getTransferEndTime(self):
+        """
+        :return: when the transfer in progress will be done in nanoseconds, or None if nothing is being transferred
+        """
+        if self.currentStep == 1 or self.currentStep == 3:
+            return self.transferStartTime + self.tradedCurrencyTransferTime
+
+        return None
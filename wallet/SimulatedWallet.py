@@ -5,7 +5,7 @@ import json
 from typing import Dict
 import random
 
-from clock.Clock import Clock
+import clock
 from data_obtaining.DataObtainer import DataObtainer
 from wallet.Wallet import Wallet
 
@@ -13,6 +13,8 @@ class SimulatedWallet(Wallet):
     baseCurrencyAmount: float
     baseCurrencyName: str
     binanceFee: float
+    # What is left of an amount after the fee, worked out once since every trade uses it
+    feeComplement: float
     minimumTradeAmount: float
     balances: Dict
 
@@ -22,6 +24,7 @@ class SimulatedWallet(Wallet):
         self.baseCurrencyAmount = baseCurrencyAmount
         self.baseCurrencyName = baseCurrencyName
         self.binanceFee = fee
+        self.feeComplement = 1.0 - fee
         self.minimumTradeAmount = minimumTradeAmount
         self.balances = {}
         self.dataObtainer = dataObtainer
@@ -35,7 +38,7 @@ class SimulatedWallet(Wallet):
         :param test: whether this is a test order or a real one
         :return: success of the transaction
         """
-        # currentTime = Clock.getInstance().getMinuteTimestamp()
+        # currentTime = clock.CLOCK.getMinuteTimestamp()
         # amountInBaseCurrency = amountInPurchaseCurrency * self.dataObtainer.obtainSingleColumnMinuteValues(ticker + self.baseCurrencyName, "Average", startTime=currentTime, endTime=currentTime)[0]
         # amountInBaseCurrency1 = amountInPurchaseCurrency * self.dataObtainer.obtainSingleColumnMinuteValues(ticker + self.baseCurrencyName, "High", startTime=currentTime, endTime=currentTime)[0]
         # amountInBaseCurrency2 = amountInPurchaseCurrency * self.dataObtainer.obtainSingleColumnMinuteValues(ticker + self.baseCurrencyName, "Low", startTime=currentTime, endTime=currentTime)[0]
@@ -54,9 +57,9 @@ class SimulatedWallet(Wallet):
             return False
 
         if ticker in self.balances:
-            self.balances[ticker] += (1 - self.binanceFee) * amountInPurchaseCurrency
+            self.balances[ticker] += self.feeComplement * amountInPurchaseCurrency
         else:
-            self.balances[ticker] = (1 - self.binanceFee) * amountInPurchaseCurrency
+            self.balances[ticker] = self.feeComplement * amountInPurchaseCurrency
 
         self.baseCurrencyAmount -= amountInBaseCurrency
         # print("Current amount of funds: " + str(self.baseCurrencyAmount) + " (FakeBinanceWallet purchase)")
@@ -69,7 +72,7 @@ class SimulatedWallet(Wallet):
         :param amount: the amount to sell, units: ticker
         :return: success of the transaction
         """
-        # currentTime = Clock.getInstance().getMinuteTimestamp()
+        # currentTime = clock.CLOCK.getMinuteTimestamp()
         # amountInBaseCurrency = amountInSellCurrency * self.dataObtainer.obtainSingleColumnMinuteValues(ticker + self.baseCurrencyName, "Average", startTime=currentTime, endTime=currentTime)[0]
         # amountInBaseCurrency1 = amountInSellCurrency * self.dataObtainer.obtainSingleColumnMinuteValues(ticker + self.baseCurrencyName, "High", startTime=currentTime, endTime=currentTime)[0]
         # amountInBaseCurrency2 = amountInSellCurrency * self.dataObtainer.obtainSingleColumnMinuteValues(ticker + self.baseCurrencyName, "Low", startTime=currentTime, endTime=currentTime)[0]
@@ -83,8 +86,8 @@ class SimulatedWallet(Wallet):
             # print("Tried to sell " + ticker + " but not enough is owned (FakeBinanceWallet).")
             return False
 
-        self.baseCurrencyAmount += (1 - self.binanceFee) * amountInBaseCurrency
-        self.env.logger.writeSecondary("buys_and_sells", "FakeBinanceWallet Sell: " + str(Clock.getInstance().getTimestamp()) + " " + str(rate) + " " + str(amountInBaseCurrency))
+        self.baseCurrencyAmount += self.feeComplement * amountInBaseCurrency
+        self.env.logger.writeSecondary("buys_and_sells", "FakeBinanceWallet Sell: " + str(clock.CLOCK.getTimestamp()) + " " + str(rate) + " " + str(amountInBaseCurrency))
         # print("Current amount of funds: " + str(self.baseCurrencyAmount) + " (FakeBinanceWallet sell)")
         return True
 
@@ -127,8 +130,6 @@ class SimulatedWallet(Wallet):
             return False
 
     def canSell(self, ticker: str, amountInSellCurrency: float) -> bool:
-        rate, _, _ = self.dataObtainer.getIntraMinuteKline(ticker + self.baseCurrencyName)
-
         if ticker in self.balances and self.balances[ticker] >= amountInSellCurrency:
             return True
         else:
@@ -160,11 +161,11 @@ class SimulatedWallet(Wallet):
 
     def getTotalValueInBaseCurrency(self) -> float:
         total = self.baseCurrencyAmount
-        currentTime = Clock.getInstance().getMinuteTimestamp()
+        currentTime = clock.CLOCK.getMinuteTimestamp()
 
-        for ticker in self.balances:
+        for ticker, balance in self.balances.items():
             rate = self.dataObtainer.obtainSingleColumnMinuteValues(ticker + self.baseCurrencyName, "Average", startTime=currentTime, endTime=currentTime)[0]
-            total += self.balances[ticker] * rate
+            total += balance * rate
 
         return total
 
@@ -172,13 +173,8 @@ class SimulatedWallet(Wallet):
         return self.binanceFee
 
     def getWithdrawalFee(self, ticker) -> float:
-        return self.withdrawalFees[ticker] if ticker in self.withdrawalFees else 0.0
+        return self.withdrawalFees.get(ticker, 0.0)
 
     def __str__(self):
-        string = "{"
-
-        for ticker in self.balances:
-            string += ticker + ": " + str(self.balances[ticker]) + " "
-
-        string += self.baseCurrencyName + ": " + str(self.baseCurrencyAmount) + "}"
-        return string
+        balances = "".join(ticker + ": " + str(balance) + " " for ticker, balance in self.balances.items())
+        return "{" + balances + self.baseCurrencyName + ": " + str(self.baseCurrencyAmount) + "}"